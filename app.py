@@ -1,20 +1,91 @@
-from fastapi import FastAPI, UploadFile, File, Query
+from fastapi import FastAPI, UploadFile, File, Query, Request, HTTPException, Depends
+from fastapi.responses import JSONResponse, Response, StreamingResponse, PlainTextResponse
 import os
-from backend.processor import build_processed_dataset
-from backend.vector_store import build_faiss_index
-from backend.rag_agent import generate_test_cases
-from backend.script_generator import generate_selenium_script
+import time
+import asyncio
+import threading
+from backend.vector_store import (
+    update_faiss_index, warm_up, status, cache_stats, read_index_version,
+    list_snapshots, rollback_index
+)
+from backend.rag_agent import (
+    agenerate_test_cases, astream_test_cases, agenerate_test_cases_batch, retrieval_sources, UnknownPage
+)
+from backend.llm_client import llm_response_cache, llm_stats, status as llm_status
+from backend.script_generator import load_pages, agenerate_selenium_script, agenerate_selenium_scripts, scripts_zip
 from backend.llm_test import test_llm
+from backend.jobs import submit_build, get_job, list_jobs, wait_job
+from backend.uploads import (
+    save_upload, publish_uploads, discard_uploads, UploadBudget, UploadTooLarge, RequestSizeLimit
+)
+from backend.projects import DEFAULT_PROJECT, project_name, kb_paths, list_projects
+from backend import metrics
 from pydantic import BaseModel
 import json
 
 app = FastAPI()
+# Oversized uploads get their 413 before the multipart body is parsed
+app.add_middleware(RequestSizeLimit)
 
-UPLOAD_DIR = "data/uploads/"
-HTML_DIR = "data/html/"
+# Upload directories of the default project; other projects get theirs on first upload
+os.makedirs(kb_paths()["docs_dir"], exist_ok=True)
+os.makedirs(kb_paths()["html_dir"], exist_ok=True)
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-os.makedirs(HTML_DIR, exist_ok=True)
+# Longest an upload with ?wait=true blocks on its build before answering 504
+BUILD_WAIT_TIMEOUT = float(os.getenv("BUILD_WAIT_TIMEOUT", "600"))
+
+# Load the embedding model + index in the background at startup (WARMUP=0 defers it to /ready)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+def start_warm_up():
+    """Start the background warm-up unless one is running or done; a failed one is retried."""
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None or (not _warm_up_thread.is_alive() and not status()["embedding_model"]):
+            _warm_up_thread = threading.Thread(target=warm_up, daemon=True)
+            _warm_up_thread.start()
+
+
+@app.on_event("startup")
+def warm_up_models():
+    if WARMUP:
+        start_warm_up()
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    """Per-request stage timings (see backend/metrics.py) and the HTTP latency histogram."""
+    metrics.start_request_timings()
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.HTTP_SECONDS.observe(
+        time.perf_counter() - started,
+        path=getattr(route, "path", "unmatched"), method=request.method, status=response.status_code
+    )
+    return response
+
+def project_param(
+    project: str = Query(DEFAULT_PROJECT, description="Knowledge base to use (project id)")
+) -> str:
+    try:
+        return project_name(project)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def page_param(
+    page: str = Query(None, description="Only use this HTML page (file name) as page context"),
+    project: str = Depends(project_param)
+) -> str:
+    # Checked up front so the streaming endpoint can still answer with a status code
+    try:
+        retrieval_sources(page, project)
+    except UnknownPage as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return page
 
 @app.get("/")
 def home():
@@ -26,49 +97,205 @@ def health_check():
         'status':'OK'
     }
 
+@app.get('/ready')
+def readiness_check():
+    """Reports which components are loaded; 503 (warming up in the background) until the embedding model is."""
+    components = {**status(), **llm_status()}
+    ready = components["embedding_model"]
+    if not ready:
+        start_warm_up()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={'ready': ready, 'components': components}
+    )
+
+@app.get('/cache_stats')
+def cache_stats_api():
+    return {**cache_stats(), "llm_responses": llm_response_cache.stats()}
+
+@app.get('/llm_stats')
+def llm_stats_api():
+    return llm_stats()
+
+@app.get('/metrics', response_class=PlainTextResponse)
+def metrics_api():
+    """Prometheus text format: stage histograms, counters, cache and LLM gauges."""
+    caches = {**cache_stats(), "llm_responses": llm_response_cache.stats()}
+    for name, stats in caches.items():
+        metrics.CACHE_HITS.set(stats["hits"], cache=name)
+        metrics.CACHE_MISSES.set(stats["misses"], cache=name)
+        metrics.CACHE_ENTRIES.set(stats.get("size", stats.get("entries", 0)), cache=name)
+    metrics.LLM_IN_FLIGHT.set(llm_stats()["totals"]["in_flight"])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get('/test_llm')
 def test_llm_api():
     out = test_llm("Say 'LLM working' in one line.")
     return {"output": out}
 
 @app.post("/upload_files")
-async def upload_files(html_file: UploadFile = File(...), support_docs: list[UploadFile] = File(...)):
-    
-    # Save HTML file
-    html_path = os.path.join(HTML_DIR, html_file.filename)
-    with open(html_path, "wb") as f:
-        f.write(await html_file.read())
+async def upload_files(
+    html_file: UploadFile = File(...),
+    support_docs: list[UploadFile] = File(...),
+    wait: bool = Query(False, description="Block until the knowledge base is rebuilt"),
+    project: str = Depends(project_param)
+):
+    """
+    Save the files to the project and queue a rebuild of its knowledge base on the build thread.
+    Returns 202 with a job id to poll at /build_jobs/{job_id}; uploads
+    arriving while a rebuild is still queued share it. Files identical to
+    ones already on disk are skipped, and no rebuild is queued if all are.
+    """
+    # Stream every file to disk in blocks, hashing as it goes; the request's
+    # files are only put in place once all of them were accepted
+    paths = kb_paths(project)
+    budget = UploadBudget()
+    saved = []
+    try:
+        saved.append(await save_upload(html_file, paths["html_dir"], budget))
+        for doc in support_docs:
+            saved.append(await save_upload(doc, paths["docs_dir"], budget))
+    except UploadTooLarge as e:
+        discard_uploads(saved)
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        discard_uploads(saved)
+        raise HTTPException(status_code=400, detail=str(e))
+    except BaseException:
+        discard_uploads(saved)
+        raise
+    publish_uploads(saved)
+
+    uploads = {
+        "saved": [f["path"] for f in saved if not f["duplicate"]],
+        "duplicates": [f["path"] for f in saved if f["duplicate"]],
+        "bytes": sum(f["bytes"] for f in saved)
+    }
+    if not uploads["saved"]:
+        return {'message': "All files are unchanged; knowledge base is up to date", 'uploads': uploads}
 
-    # Save support documents
-    for doc in support_docs:
-        doc_path = os.path.join(UPLOAD_DIR, doc.filename)
-        with open(doc_path, "wb") as f:
-            f.write(await doc.read())
+    # Keyed per project, so uploads only coalesce with builds of the same knowledge base
+    job = submit_build(lambda progress: update_faiss_index(progress=progress, project=project), key=project)
 
-    processed_text = build_processed_dataset()
-    faiss_info = build_faiss_index(processed_text)
+    job_id = job["id"]
+    queued = {
+        'project': project,
+        'job_id': job_id,
+        'status_url': f"/build_jobs/{job_id}",
+        'coalesced': job["submissions"] > 1,
+        'uploads': uploads
+    }
+
+    if wait:
+        job = await asyncio.to_thread(wait_job, job_id, BUILD_WAIT_TIMEOUT)
+        if job is None:
+            # Finished, but its record was already trimmed from the job list
+            return JSONResponse(status_code=202, content={
+                'message': "Files uploaded; knowledge base build finished, its result is no longer kept",
+                **queued
+            })
+        if job["status"] not in ("done", "failed"):
+            return JSONResponse(status_code=504, content={
+                'message': f"Knowledge base build still {job['status']} after {BUILD_WAIT_TIMEOUT:g}s",
+                **queued
+            })
+        if job["status"] == "failed":
+            return JSONResponse(status_code=500, content={"error": job["error"], "job_id": job_id})
+        return build_summary(job["result"])
+
+    return JSONResponse(status_code=202, content={
+        'message': "Files uploaded; knowledge base build queued",
+        **queued
+    })
 
+def build_summary(faiss_info: dict) -> dict:
     return{
         'message': "Files uploaded and processed successfully",
-        'processed length': len(processed_text),
-        'faiss info': faiss_info["num_chunks"]
+        'processed length': faiss_info["processed_length"],
+        'faiss info': faiss_info["num_chunks"],
+        'embedded chunks': faiss_info["embedded_chunks"],
+        'files': {
+            'added': faiss_info["added"],
+            'changed': faiss_info["changed"],
+            'removed': faiss_info["removed"],
+            'unchanged': faiss_info["unchanged"]
+        },
+        'extraction': faiss_info["extraction"]
     }
 
+@app.get("/build_jobs")
+def build_jobs_api():
+    return {"jobs": list_jobs()}
+
+@app.get("/build_jobs/{job_id}")
+def build_job_status(job_id: str):
+    """Status of a knowledge-base build: stage, progress and, once done, the build summary."""
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": f"Unknown job '{job_id}'"})
+    if job["status"] == "done":
+        job["result"] = build_summary(job["result"])
+    return job
+
+@app.get("/projects")
+def projects_api():
+    """Projects with a knowledge base on disk, and whether their index is loaded in memory."""
+    loaded = status()["index_versions"]
+    return {"projects": [
+        {"project": name, "index_version": read_index_version(name), "loaded": name in loaded}
+        for name in list_projects()
+    ]}
+
+@app.get("/index/snapshots")
+def snapshots_api(project: str = Depends(project_param)):
+    """Kept index snapshots of a project (oldest first) and the one being served."""
+    return {"project": project, "current": read_index_version(project), "snapshots": list_snapshots(project)}
+
+@app.post("/index/rollback")
+def rollback_api(
+    project: str = Depends(project_param),
+    version: str = Query(None, description="Snapshot to serve (default: the one before the current)")
+):
+    """Serve an older kept snapshot; queries switch to it on their next index lookup."""
+    try:
+        return rollback_index(project, version)
+    except ValueError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+@app.get("/pages")
+def pages_api(project: str = Depends(project_param)):
+    """Uploaded HTML pages of a project with their title and number of indexed elements."""
+    return {"pages": [
+        {"name": page["name"], "title": page["title"], "elements": page["elements"]}
+        for page in load_pages(project)["pages"]
+    ]}
+
 @app.post("/generate_test_cases")
-def generate_test_cases_api(query: str = Query(..., description="User query for test case generation")):
+async def generate_test_cases_api(
+    query: str = Query(..., description="User query for test case generation"),
+    use_cache: bool = Query(True, description="Reuse a cached LLM response for an identical prompt"),
+    page: str = Depends(page_param),
+    context_tokens: int = Query(None, description="Token budget for retrieved context (default CONTEXT_TOKEN_BUDGET)"),
+    timings: bool = Query(False, description="Add a per-stage timing breakdown (seconds) to the response"),
+    project: str = Depends(project_param)
+):
     """
     API endpoint to run the RAG test case generator.
     """
     
-    result = generate_test_cases(query)
+    result = await agenerate_test_cases(query, use_cache=use_cache, page=page, budget=context_tokens, project=project)
 
     if result["parsed"] is None:
         return {
             "query": query,
             "raw_llm": result["raw_llm"],
             "parsed": None,
-            "error": "LLM output too large or incomplete. Try requesting fewer test cases.",
-            "context_used": result["used_context"]
+            "error": result["error"] if not result["raw_llm"] else "LLM output too large or incomplete, and no complete test case could be recovered. Try requesting fewer test cases.",
+            "context_used": result["used_context"],
+            "sources": result["sources"],
+            "llm": result.get("llm"),
+            "context": result.get("context"),
+            **timing_breakdown(timings)
         }
 
     return {
@@ -76,20 +303,124 @@ def generate_test_cases_api(query: str = Query(..., description="User query for
         "raw_llm": result["raw_llm"],
         "parsed": result["parsed"],
         "error": result["error"],
-        "context_used": result["used_context"]
+        "context_used": result["used_context"],
+        "sources": result["sources"],
+        "llm": result.get("llm"),
+        "context": result.get("context"),
+        "continuation": result.get("continuation"),
+        **timing_breakdown(timings)
+    }
+
+def timing_breakdown(enabled: bool) -> dict:
+    return {"timings": metrics.request_timings()} if enabled else {}
+
+class TestCaseBatchRequest(BaseModel):
+    queries: list[str]
+
+@app.post("/generate_test_cases/batch")
+async def generate_test_cases_batch_api(
+    request: TestCaseBatchRequest,
+    use_cache: bool = Query(True, description="Reuse a cached LLM response for an identical prompt"),
+    page: str = Depends(page_param),
+    context_tokens: int = Query(None, description="Token budget for retrieved context (default CONTEXT_TOKEN_BUDGET)"),
+    timings: bool = Query(False, description="Add a per-stage timing breakdown (seconds) to the response"),
+    project: str = Depends(project_param)
+):
+    """
+    Test cases for many queries in one call: retrieval is batched (one encode,
+    one index search) and the LLM calls run concurrently.
+    """
+    batch = await agenerate_test_cases_batch(request.queries, use_cache=use_cache, page=page, budget=context_tokens,
+                                             project=project)
+    return {
+        "results": [
+            {
+                "query": r["query"],
+                "parsed": r["parsed"],
+                "error": r["error"],
+                "sources": r["sources"],
+                "llm": r.get("llm"),
+                "context": r.get("context"),
+                "continuation": r.get("continuation")
+            }
+            for r in batch["results"]
+        ],
+        "timing": batch["timing"],
+        **timing_breakdown(timings)
     }
 
 class SeleniumRequest(BaseModel):
     test_case: dict
 
+@app.post("/generate_test_cases/stream")
+async def stream_test_cases_api(
+    query: str = Query(..., description="User query for test case generation"),
+    use_cache: bool = Query(True, description="Reuse a cached LLM response for an identical prompt"),
+    page: str = Depends(page_param),
+    context_tokens: int = Query(None, description="Token budget for retrieved context (default CONTEXT_TOKEN_BUDGET)"),
+    timings: bool = Query(False, description="Add a per-stage timing breakdown (seconds) to the response"),
+    project: str = Depends(project_param)
+):
+    """
+    Server-Sent Events variant of /generate_test_cases: a `context` event once
+    retrieval is done, a `test_case` event per test case as soon as the model
+    has written it, then a `done` event with the full result.
+    """
+    async def events():
+        async for event, data in astream_test_cases(query, use_cache=use_cache, page=page, budget=context_tokens,
+                                                    project=project):
+            if event == "done":
+                data = {**data, **timing_breakdown(timings)}
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/generate_selenium_script")
-def generate_selenium_api(test_case: dict):
+async def generate_selenium_api(test_case: dict, use_cache: bool = Query(True), timings: bool = Query(False),
+                                project: str = Depends(project_param)):
     
-    script, errors = generate_selenium_script(test_case)
+    script, errors = await agenerate_selenium_script(test_case, use_cache=use_cache, project=project)
     
     return {
         "test_case_id": test_case.get("id"),
         "selenium_script": script,
         "errors": errors,
-        "success": len(errors) == 0
-    }
\ No newline at end of file
+        "success": len(errors) == 0,
+        **timing_breakdown(timings)
+    }
+
+class SeleniumBatchRequest(BaseModel):
+    test_cases: list[dict]
+
+@app.post("/generate_selenium_scripts")
+async def generate_selenium_batch_api(
+    request: SeleniumBatchRequest,
+    use_cache: bool = Query(True),
+    format: str = Query("json", description="'json' for per-case results, 'zip' for a zip of .py files"),
+    timings: bool = Query(False, description="Add a per-stage timing breakdown (json format only)"),
+    project: str = Depends(project_param)
+):
+    """
+    Generate Selenium scripts for a whole list of test cases concurrently.
+    """
+    started = time.perf_counter()
+    results = await agenerate_selenium_scripts(request.test_cases, use_cache=use_cache, project=project)
+
+    if format == "zip":
+        return Response(
+            content=scripts_zip(results),
+            media_type="application/zip",
+            headers={"Content-Disposition": "attachment; filename=selenium_scripts.zip"}
+        )
+
+    return {
+        "results": results,
+        "total": len(results),
+        "succeeded": sum(1 for r in results if r["success"]),
+        "seconds": round(time.perf_counter() - started, 3),
+        **timing_breakdown(timings)
+    }
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with hit/miss counters. With
+    max_weight, entries are also evicted while the sum of weigh(value)
+    is over it (the newest entry is always kept).
+    """
+
+    _MISSING = object()
+
+    def __init__(self, maxsize: int = 1024, max_weight: int = 0, weigh=None):
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weights = {}
+        self.weight = 0
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            value = self.data.get(key, self._MISSING)
+            if value is self._MISSING:
+                self.misses += 1
+                return default
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            if self.weigh is not None:
+                self.weight += self.weigh(value) - self.weights.get(key, 0)
+                self.weights[key] = self.weigh(value)
+            while len(self.data) > self.maxsize or (
+                self.max_weight and self.weight > self.max_weight and len(self.data) > 1
+            ):
+                old_key, _ = self.data.popitem(last=False)
+                self.weight -= self.weights.pop(old_key, 0)
+
+    def items(self):
+        """Snapshot of the entries, without counting as lookups."""
+        with self.lock:
+            return list(self.data.items())
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.weights.clear()
+            self.weight = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.data),
+                "maxsize": self.maxsize,
+                **({"weight": self.weight, "max_weight": self.max_weight} if self.weigh is not None else {}),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache for LLM responses, keyed on model name,
+    generation config and a hash of the prompt. Entries expire after
+    `ttl` seconds; the least recently used are evicted past `max_bytes`.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.conn = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, config: dict, prompt: str) -> str:
+        raw = json.dumps(
+            {"model": model, "config": config, "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest()},
+            sort_keys=True
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        # Opened on first use, so importing the module never touches disk
+        if self.conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, response TEXT, "
+                "created REAL, last_used REAL, size INTEGER)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        return self.conn
+
+    def get(self, key: str):
+        now = time.time()
+        with self.lock:
+            conn = self._connect()
+            row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    conn.commit()
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self.lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, now, now, size)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now: float):
+        conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self.lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self):
+        with self.lock:
+            conn = self._connect()
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "entries": count,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,120 @@
+import os
+import json
+import mmap
+import struct
+import numpy as np
+from typing import Dict, Any, Iterable, Optional
+
+# File layout:
+#   records      one UTF-8 JSON object per chunk {"text", "source", "doc_type", "start", "end"}
+#   table        TABLE_DTYPE rows sorted by id
+#   footer       MAGIC, table offset, chunk count
+MAGIC = b"QACHUNK1"
+FOOTER = struct.Struct("<8sQQ")
+TABLE_DTYPE = np.dtype([("id", "<i8"), ("offset", "<u8"), ("length", "<u4")])
+
+
+class ChunkStoreWriter:
+    """Streams chunk records to disk; the offset table is written on close()."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.rows = []
+
+    def add(self, chunk_id: int, text: str, source: str = None, doc_type: str = None,
+            start: int = None, end: int = None):
+        record = json.dumps({
+            "text": text,
+            "source": source,
+            "doc_type": doc_type,
+            "start": start,
+            "end": end
+        }, ensure_ascii=False).encode("utf-8")
+        self.add_raw(chunk_id, record)
+
+    def add_raw(self, chunk_id: int, record: bytes):
+        """Append an already-encoded record (used to carry chunks over between builds)."""
+        self.rows.append((int(chunk_id), self.file.tell(), len(record)))
+        self.file.write(record)
+
+    def copy_from(self, store: "ChunkStore", ids: Iterable[int]):
+        """Copy records from another store byte for byte, without decoding them."""
+        for chunk_id in ids:
+            record = store.get_raw(chunk_id)
+            if record is not None:
+                self.add_raw(chunk_id, record)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def close(self):
+        table = np.array(sorted(self.rows), dtype=TABLE_DTYPE)
+        table_offset = self.file.tell()
+        self.file.write(table.tobytes())
+        self.file.write(FOOTER.pack(MAGIC, table_offset, len(table)))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Discard the store being written (nothing to do once closed)."""
+        if not self.file.closed:
+            self.file.close()
+            os.remove(self.tmp_path)
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped chunk store. A lookup by FAISS id binary-searches
+    the offset table and decodes only that chunk's bytes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, table_offset, count = FOOTER.unpack_from(self.mm, len(self.mm) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a chunk store")
+
+        self.table = np.frombuffer(self.mm, dtype=TABLE_DTYPE, count=count, offset=table_offset)
+
+    def __len__(self):
+        return len(self.table)
+
+    def _row(self, chunk_id) -> Optional[int]:
+        ids = self.table["id"]
+        pos = int(np.searchsorted(ids, chunk_id))
+        if pos < len(ids) and ids[pos] == chunk_id:
+            return pos
+        return None
+
+    def get_raw(self, chunk_id) -> Optional[bytes]:
+        pos = self._row(chunk_id)
+        if pos is None:
+            return None
+        row = self.table[pos]
+        offset = int(row["offset"])
+        return self.mm[offset:offset + int(row["length"])]
+
+    def get(self, chunk_id) -> Optional[Dict[str, Any]]:
+        """Chunk text plus provenance (source, doc_type, start, end), or None."""
+        record = self.get_raw(chunk_id)
+        if record is None:
+            return None
+        return json.loads(record)
+
+    def __getitem__(self, chunk_id) -> str:
+        chunk = self.get(chunk_id)
+        if chunk is None:
+            raise KeyError(chunk_id)
+        return chunk["text"]
+
+
+def open_chunk_store(path: str) -> Optional[ChunkStore]:
+    if not os.path.exists(path):
+        return None
+    return ChunkStore(path)
@@ -0,0 +1,297 @@
+import os
+import re
+from typing import List, Tuple, Iterator, Callable, Dict
+
+# Chunk size in embedding-model tokens. all-MiniLM-L6-v2 truncates input at
+# 256 word pieces, so anything above that would never reach the embedding.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "180"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "20"))
+
+# Bump when the chunking rules change, so stored embedding rows are not reused
+CHUNKER_VERSION = "3"
+
+DOC_HEADER = re.compile(r"^### (HTML FILE|PDF DOC|SUPPORT DOC): (.+)$", re.MULTILINE)
+MD_HEADING = re.compile(r"^#{1,6} .*$", re.MULTILINE)
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\S+")
+APPROX_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+Span = Tuple[int, int]
+
+
+# ---------- token counting ----------
+
+_token_counter = None
+
+
+def set_token_counter(counter: Callable[[str], int]):
+    """Override how chunk sizes are measured (e.g. a provider's tokenizer)."""
+    global _token_counter
+    _token_counter = counter
+
+
+def count_tokens(text: str) -> int:
+    """
+    Tokens of text for the embedding model. Uses the model's tokenizer when it
+    has one, else a word/punctuation estimate.
+    """
+    global _token_counter
+
+    if _token_counter is None:
+        from backend.vector_store import get_embedding_model
+        tokenizer = getattr(get_embedding_model(), "tokenizer", None)
+        if tokenizer is not None:
+            _token_counter = lambda t: len(tokenizer(t, add_special_tokens=False)["input_ids"])
+        else:
+            _token_counter = lambda t: len(APPROX_TOKEN.findall(t))
+
+    return _token_counter(text)
+
+
+def chunker_signature() -> str:
+    """Identifies the chunking settings; part of the key for stored embedding rows."""
+    return f"{CHUNKER_VERSION}-{CHUNK_TOKENS}-{CHUNK_OVERLAP_TOKENS}"
+
+
+# ---------- splitting into units ----------
+
+def _trim(text: str, start: int, end: int) -> Span:
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _split(text: str, start: int, end: int, pattern) -> List[Span]:
+    """Split text[start:end] at the matches of pattern (separators dropped)."""
+    spans = []
+    pos = start
+    for m in pattern.finditer(text, start, end):
+        spans.append(_trim(text, pos, m.start()))
+        pos = m.end()
+    spans.append(_trim(text, pos, end))
+    return [s for s in spans if s[1] > s[0]]
+
+
+def _split_before(text: str, start: int, end: int, pattern) -> List[Span]:
+    """Split text[start:end] so every match of pattern starts a new span."""
+    cuts = [m.start() for m in pattern.finditer(text, start, end) if m.start() > start]
+    bounds = [start] + cuts + [end]
+    spans = [_trim(text, a, b) for a, b in zip(bounds, bounds[1:])]
+    return [s for s in spans if s[1] > s[0]]
+
+
+def _hard_split(text: str, start: int, end: int, max_tokens: int) -> List[Span]:
+    """Last resort for units too big to pack: word windows, then raw characters."""
+    words = [(m.start(), m.end()) for m in WORD.finditer(text, start, end)]
+    if len(words) > 1:
+        spans, first, tokens = [], words[0][0], 0
+        for w_start, w_end in words:
+            n = count_tokens(text[w_start:w_end])
+            if tokens and tokens + n > max_tokens:
+                spans.append((first, prev_end))
+                first, tokens = w_start, 0
+            tokens += n
+            prev_end = w_end
+        spans.append((first, prev_end))
+        return spans
+
+    step = max(1, max_tokens * 3)
+    return [(s, min(s + step, end)) for s in range(start, end, step)]
+
+
+def _fit(text: str, span: Span, max_tokens: int, splitters) -> List[Span]:
+    """Recursively split a span with the next splitter until every piece fits."""
+    start, end = _trim(text, *span)
+    if end <= start:
+        return []
+    if count_tokens(text[start:end]) <= max_tokens:
+        return [(start, end)]
+    if not splitters:
+        return _hard_split(text, start, end, max_tokens)
+
+    pieces = splitters[0](text, start, end)
+    if len(pieces) <= 1:
+        return _fit(text, span, max_tokens, splitters[1:])
+
+    fitted = []
+    for piece in pieces:
+        fitted.extend(_fit(text, piece, max_tokens, splitters[1:] or splitters))
+    return fitted
+
+
+def paragraphs(text, start, end):
+    return _split(text, start, end, PARAGRAPH_BREAK)
+
+
+def lines(text, start, end):
+    return _split(text, start, end, re.compile(r"\n"))
+
+
+def sentences(text, start, end):
+    return _split(text, start, end, SENTENCE_END)
+
+
+def headings(text, start, end):
+    return _split_before(text, start, end, MD_HEADING)
+
+
+def json_members(text: str, start: int, end: int) -> List[Span]:
+    """
+    Spans of the direct members of the JSON object/array in text[start:end],
+    found by scanning brackets and strings, so the original formatting is kept.
+    Returns the span itself when it is not an object or array.
+    """
+    start, end = _trim(text, start, end)
+    if end - start < 2 or text[start] not in "{[":
+        return [(start, end)]
+
+    members = []
+    depth = 0
+    in_string = False
+    escaped = False
+    member_start = start + 1
+
+    for i in range(start, end):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                members.append(_trim(text, member_start, i))
+                break
+        elif ch == "," and depth == 1:
+            members.append(_trim(text, member_start, i))
+            member_start = i + 1
+
+    return [m for m in members if m[1] > m[0]] or [(start, end)]
+
+
+def json_value(text: str, start: int, end: int) -> List[Span]:
+    """Split a `"key": {...}` member into its key and the members of its value."""
+    m = re.compile(r'\s*"(?:[^"\\]|\\.)*"\s*:\s*').match(text, start, end)
+    if not m:
+        return json_members(text, start, end)
+    # The key stays a unit of its own, so it is packed with the first member
+    return [_trim(text, start, m.end())] + json_members(text, m.end(), end)
+
+
+# ---------- packing ----------
+
+def pack(text: str, units: List[Span], max_tokens: int, overlap_tokens: int) -> Iterator[Tuple[int, int, str]]:
+    """
+    Greedily pack consecutive units into chunks of at most max_tokens.
+    The trailing units of a chunk (up to overlap_tokens) are repeated at
+    the start of the next one. Yields (start, end, chunk_text).
+    """
+    sizes = [count_tokens(text[s:e]) for s, e in units]
+    # Tokens between a unit and the previous one (e.g. JSON commas), which a chunk spanning both includes
+    gaps = [0] + [count_tokens(text[a[1]:b[0]]) for a, b in zip(units, units[1:])]
+    i = 0
+
+    while i < len(units):
+        j, tokens = i, 0
+        while j < len(units) and (j == i or tokens + gaps[j] + sizes[j] <= max_tokens):
+            tokens += sizes[j] + (gaps[j] if j > i else 0)
+            j += 1
+
+        start, end = units[i][0], units[j - 1][1]
+        yield start, end, text[start:end]
+
+        if j >= len(units):
+            break
+
+        # Step back over whole units for the overlap, but always move forward
+        back, carried = j, 0
+        while back - 1 > i and carried + sizes[back - 1] + (gaps[back] if back < j else 0) <= overlap_tokens:
+            back -= 1
+            carried += sizes[back] + (gaps[back + 1] if back + 1 < j else 0)
+        i = back
+
+
+# ---------- chunkers per document kind ----------
+
+def chunk_prose(text, max_tokens, overlap_tokens):
+    units = _fit(text, (0, len(text)), max_tokens, [paragraphs, lines, sentences])
+    return pack(text, units, max_tokens, overlap_tokens)
+
+
+def chunk_lines(text, max_tokens, overlap_tokens):
+    """HTML and PDF extraction emit one stripped line per block."""
+    units = _fit(text, (0, len(text)), max_tokens, [lines, sentences])
+    return pack(text, units, max_tokens, overlap_tokens)
+
+
+def chunk_markdown(text, max_tokens, overlap_tokens):
+    """Splits at headings first, so a chunk only crosses one when small sections are packed together."""
+    units = []
+    for section in headings(text, 0, len(text)):
+        units.extend(_fit(text, section, max_tokens, [paragraphs, lines, sentences]))
+    return pack(text, units, max_tokens, overlap_tokens)
+
+
+def chunk_json(text, max_tokens, overlap_tokens):
+    """Chunks hold whole JSON members; oversized members are split into theirs."""
+    header = DOC_HEADER.search(text)
+    header_end = header.end() if header else 0
+    units = [_trim(text, 0, header_end)] if header else []
+    for member in json_members(text, header_end, len(text)):
+        units.extend(_fit(text, member, max_tokens, [json_value, lines]))
+    units = [u for u in units if u[1] > u[0]]
+    # Structure is kept intact, so no overlap is carried between members
+    return pack(text, units, max_tokens, 0)
+
+
+def chunk_fixed(text, max_tokens, overlap_tokens):
+    """The original fixed 500/50 character windows, kept as a plug-in."""
+    start = 0
+    while start < len(text):
+        end = min(start + 500, len(text))
+        yield start, end, text[start:end]
+        start += 450
+
+
+CHUNKERS: Dict[str, Callable] = {
+    "html": chunk_lines,
+    "pdf": chunk_lines,
+    "markdown": chunk_markdown,
+    "json": chunk_json,
+    "text": chunk_prose,
+    "fixed": chunk_fixed
+}
+
+
+def register_chunker(kind: str, chunker: Callable):
+    """Plug in a chunker: chunker(text, max_tokens, overlap_tokens) -> iter of (start, end, text)."""
+    CHUNKERS[kind] = chunker
+
+
+def document_kind(path: str, doc_type: str) -> str:
+    """Which chunker handles a source file."""
+    if doc_type in ("html", "pdf"):
+        return doc_type
+    ext = os.path.splitext(path or "")[1].lower()
+    return {".md": "markdown", ".json": "json"}.get(ext, "text")
+
+
+def chunk_document(text: str, kind: str = "text", max_tokens: int = None,
+                   overlap_tokens: int = None) -> Iterator[Tuple[int, int, str]]:
+    """Chunk one extracted document. Yields (start, end, chunk_text) spans of text."""
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    chunker = CHUNKERS.get(kind, chunk_prose)
+    return chunker(text, max_tokens, overlap_tokens)
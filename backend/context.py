@@ -0,0 +1,159 @@
+import os
+from typing import Dict, Any, List, Tuple
+
+import numpy as np
+
+from backend.chunker import count_tokens
+from backend.metrics import timed
+from backend.vector_store import search_chunks_batch, chunk_embeddings, embed_query, get_embedding_model
+
+# Prompt context is filled up to this many tokens (embedding-model tokens, a
+# close stand-in for the LLM's count) instead of a fixed number of chunks
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Candidates retrieved before merging / dedup / MMR pick from them
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "24"))
+# MMR trade-off: 1.0 is pure relevance, lower values favour diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Cosine similarity above which two passages count as duplicates
+DUPLICATE_SIMILARITY = float(os.getenv("DUPLICATE_SIMILARITY", "0.95"))
+# Chunks of one document at most this many characters apart are merged,
+# into passages of at most MAX_PASSAGE_TOKENS so one passage cannot eat the budget
+MERGE_GAP_CHARS = 2
+MAX_PASSAGE_TOKENS = int(os.getenv("MAX_PASSAGE_TOKENS", "400"))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def merge_adjacent(chunks: List[Dict[str, Any]], vectors: np.ndarray) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Merge chunks of the same document whose spans overlap or touch, so the
+    overlap is sent once. A merged passage keeps the best distance of its
+    chunks and the mean of their embeddings. When a passage would grow past
+    MAX_PASSAGE_TOKENS the next chunk starts a new one, minus the overlap.
+    """
+    order = sorted(range(len(chunks)), key=lambda i: (chunks[i]["source"] or "", chunks[i]["start"] or 0))
+    passages, members = [], []
+
+    for i in order:
+        chunk = chunks[i]
+        last = passages[-1] if passages else None
+        touches = (
+            last is not None and chunk["start"] is not None and last["end"] is not None
+            and chunk["source"] == last["source"]
+            and chunk["start"] <= last["end"] + MERGE_GAP_CHARS
+        )
+        overlap = max(0, last["end"] - chunk["start"]) if touches else 0
+
+        if touches and chunk["end"] <= last["end"]:
+            # Contained in the passage already
+            last["distance"] = min(last["distance"], chunk["distance"])
+            last["ids"].append(chunk["id"])
+            members[-1].append(i)
+            continue
+
+        tail = chunk["text"][overlap:]
+        if touches and count_tokens(last["text"] + tail) <= MAX_PASSAGE_TOKENS:
+            last["text"] += tail if overlap else "\n" + tail
+            last["end"] = chunk["end"]
+            last["distance"] = min(last["distance"], chunk["distance"])
+            last["ids"].append(chunk["id"])
+            members[-1].append(i)
+        else:
+            passages.append({**chunk, "text": tail, "start": chunk["start"] + overlap if touches else chunk["start"],
+                             "ids": [chunk["id"]]})
+            members.append([i])
+
+    merged_vectors = np.vstack([vectors[m].mean(axis=0) for m in members]) if members else vectors
+    return passages, merged_vectors
+
+
+def mmr_order(query_vector: np.ndarray, vectors: np.ndarray, lam: float = None) -> Tuple[List[int], List[int]]:
+    """
+    Maximal marginal relevance ordering of normalized vectors. Near-duplicates
+    of an already picked passage are dropped. Returns (order, dropped).
+    """
+    lam = MMR_LAMBDA if lam is None else lam
+    relevance = vectors @ query_vector
+    similarity = vectors @ vectors.T
+
+    remaining = list(range(len(vectors)))
+    order, dropped = [], []
+    while remaining:
+        if order:
+            redundancy = similarity[np.ix_(remaining, order)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lam * relevance[remaining] - (1 - lam) * redundancy
+        best = remaining.pop(int(np.argmax(scores)))
+        if order and similarity[best, order].max() >= DUPLICATE_SIMILARITY:
+            dropped.append(best)
+        else:
+            order.append(best)
+    return order, dropped
+
+
+def format_block(position: int, passage: Dict[str, Any]) -> str:
+    source = os.path.basename(passage["source"]) if passage["source"] else passage["doc_type"]
+    return f"[CHUNK {position} | source={source} | distance={passage['distance']}]\n{passage['text'].strip()}"
+
+
+def assemble_context(query: str, budget: int = None, candidates: int = None, sources=None, project: str = None):
+    """
+    Retrieve candidates, merge overlapping/adjacent chunks, drop near-duplicates,
+    order by MMR and fill the token budget. Returns (context_blocks, passages,
+    stats), or (None, [], stats) when no knowledge base has been built.
+    Passages that do not fit are skipped, so smaller ones further down still can;
+    context_blocks is [] when none matched or fit.
+    """
+    return assemble_contexts([query], budget, candidates, sources, project)[0]
+
+
+def assemble_contexts(queries: List[str], budget: int = None, candidates: int = None, sources=None,
+                      project: str = None):
+    """assemble_context() for many queries, with one batched embed + search for all of them."""
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    batch = search_chunks_batch(queries, top_k=candidates or CONTEXT_CANDIDATES, sources=sources, project=project)
+    if batch is None:
+        return [pack_context(query, None, budget) for query in queries]
+    return [pack_context(query, results, budget, project) for query, results in zip(queries, batch)]
+
+
+def pack_context(query: str, results, budget: int, project: str = None):
+    with timed("context_packing"):
+        return _pack_context(query, results, budget, project)
+
+
+def _pack_context(query: str, results, budget: int, project: str = None):
+    stats = {"budget_tokens": budget, "candidates": 0, "passages": 0, "duplicates": 0,
+             "selected": 0, "context_tokens": 0}
+    if results is None:
+        return None, [], stats
+    stats["candidates"] = len(results)
+    if not results:
+        return [], [], stats
+
+    vectors = chunk_embeddings(results, project)
+    if vectors is None:
+        vectors = np.asarray(get_embedding_model().encode([r["text"] for r in results]), dtype="float32")
+
+    passages, vectors = merge_adjacent(results, vectors)
+    order, dropped = mmr_order(_normalize(embed_query(query))[0], _normalize(vectors))
+    stats["passages"] = len(passages)
+    stats["duplicates"] = len(dropped)
+
+    blocks, selected, used = [], [], 0
+    for i in order:
+        block = format_block(len(blocks) + 1, passages[i])
+        tokens = count_tokens(block)
+        if used + tokens > budget:
+            continue
+        blocks.append(block)
+        selected.append(passages[i])
+        used += tokens
+
+    stats["selected"] = len(selected)
+    stats["context_tokens"] = used
+    return blocks, selected, stats
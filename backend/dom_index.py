@@ -0,0 +1,386 @@
+import os
+import re
+import json
+import threading
+from typing import Dict, Any, List, Optional
+
+from bs4 import BeautifulSoup
+
+from backend.cache import LRUCache
+from backend.manifest import file_sha256, cached_file_sha256
+
+# One JSON locator index per page content hash
+LOCATORS_DIR = "data/locators"
+# Bump when the extraction rules change, so cached indexes are rebuilt
+DOM_INDEX_VERSION = "2"
+# Elements sent to the model per test case
+MAX_PROMPT_ELEMENTS = int(os.getenv("MAX_PROMPT_ELEMENTS", "25"))
+# Pages a single test case is routed to
+MAX_PAGES_PER_CASE = int(os.getenv("MAX_PAGES_PER_CASE", "2"))
+
+INTERACTIVE_TAGS = ["input", "select", "textarea", "button", "a", "form", "option", "label"]
+CSS_IDENT = re.compile(r"^[A-Za-z_][\w-]*$")
+WORD = re.compile(r"[a-z0-9]+")
+STOP_WORDS = {
+    "the", "a", "an", "and", "or", "to", "of", "in", "on", "is", "be", "with", "for",
+    "that", "it", "as", "at", "by", "user", "page", "should", "field", "click", "enter", "verify"
+}
+
+locator_index_cache = LRUCache(int(os.getenv("LOCATOR_CACHE_SIZE", "64")))
+
+
+# ---------- building ----------
+
+def _text(el, limit: int = 80) -> str:
+    text = " ".join(el.get_text(" ", strip=True).split())
+    return text[:limit]
+
+
+def _css_path(el) -> str:
+    """tag:nth-of-type() path from the nearest ancestor with a usable id (or the root)."""
+    parts = []
+    while el is not None and el.name not in (None, "[document]"):
+        el_id = el.get("id")
+        if el_id and CSS_IDENT.match(el_id) and parts:
+            parts.append(f"#{el_id}")
+            break
+        siblings = [s for s in el.parent.find_all(el.name, recursive=False)] if el.parent else [el]
+        if len(siblings) > 1:
+            parts.append(f"{el.name}:nth-of-type({siblings.index(el) + 1})")
+        else:
+            parts.append(el.name)
+        el = el.parent
+    return " > ".join(reversed(parts))
+
+
+def _xpath_path(el) -> str:
+    parts = []
+    while el is not None and el.name not in (None, "[document]"):
+        siblings = el.parent.find_all(el.name, recursive=False) if el.parent else [el]
+        parts.append(f"{el.name}[{siblings.index(el) + 1}]" if len(siblings) > 1 else el.name)
+        el = el.parent
+    return "/" + "/".join(reversed(parts))
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _selectors(el, id_counts: Dict[str, int], name_counts: Dict[tuple, int]) -> Dict[str, str]:
+    """Most stable unique selector: id, then data-testid, then name (+ value), then the element's path."""
+    el_id = el.get("id")
+    if el_id and id_counts.get(el_id) == 1:
+        css = f"#{el_id}" if CSS_IDENT.match(el_id) else f'[id="{_quote(el_id)}"]'
+        return {"css": css, "xpath": f'//*[@id="{_quote(el_id)}"]'}
+
+    test_id = el.get("data-testid")
+    if test_id:
+        return {"css": f'[data-testid="{_quote(test_id)}"]', "xpath": f'//*[@data-testid="{_quote(test_id)}"]'}
+
+    name = el.get("name")
+    if name and name_counts.get((el.name, name)) == 1:
+        return {"css": f'{el.name}[name="{_quote(name)}"]', "xpath": f'//{el.name}[@name="{_quote(name)}"]'}
+
+    # Radio buttons / checkboxes share a name and differ by value
+    value = el.get("value")
+    if name and value and name_counts.get((el.name, name, value)) == 1:
+        return {
+            "css": f'{el.name}[name="{_quote(name)}"][value="{_quote(value)}"]',
+            "xpath": f'//{el.name}[@name="{_quote(name)}" and @value="{_quote(value)}"]'
+        }
+
+    return {"css": _css_path(el), "xpath": _xpath_path(el)}
+
+
+def _label_for(el, labels: Dict[str, str]) -> Optional[str]:
+    if el.get("aria-label"):
+        return el["aria-label"]
+    if el.get("id") in labels:
+        return labels[el["id"]]
+    wrapping = el.find_parent("label")
+    if wrapping is not None:
+        return _text(wrapping)
+    return None
+
+
+def build_locator_index(html: str) -> Dict[str, Any]:
+    """
+    Compact locator index of a page: forms, inputs, selects, textareas,
+    buttons, links and any other element with an id (e.g. message boxes),
+    each with its label/text and a stable CSS and XPath selector.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    for tag in soup(["script", "style", "noscript"]):
+        tag.extract()
+
+    id_counts, name_counts = {}, {}
+    for el in soup.find_all(True):
+        if el.get("id"):
+            id_counts[el["id"]] = id_counts.get(el["id"], 0) + 1
+        if el.get("name"):
+            for key in ((el.name, el["name"]), (el.name, el["name"], el.get("value"))):
+                name_counts[key] = name_counts.get(key, 0) + 1
+
+    labels = {label["for"]: _text(label) for label in soup.find_all("label") if label.get("for")}
+
+    elements = []
+    for el in soup.find_all(True):
+        if el.name in ("label", "option", "html", "head", "body", "title"):
+            continue
+        if el.name not in INTERACTIVE_TAGS and not el.get("id") and not el.get("onclick") \
+                and el.get("role") not in ("button", "link", "alert", "status"):
+            continue
+
+        form = el.find_parent("form")
+        entry = {
+            "tag": el.name,
+            "type": el.get("type"),
+            "role": el.get("role"),
+            "id": el.get("id"),
+            "name": el.get("name"),
+            "label": _label_for(el, labels),
+            "placeholder": el.get("placeholder"),
+            "text": _text(el) if el.name in ("button", "a") or el.name not in INTERACTIVE_TAGS else None,
+            "value": el.get("value") if el.name in ("input", "button") else None,
+            "form": (form.get("id") or form.get("name")) if form is not None else None,
+            **_selectors(el, id_counts, name_counts)
+        }
+        if el.name == "select":
+            entry["options"] = [_text(o, 40) for o in el.find_all("option")][:20]
+        elements.append({k: v for k, v in entry.items() if v not in (None, "", [])})
+
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    headings = [_text(h) for h in soup.find_all(["h1", "h2", "h3"])][:20]
+    return {"version": DOM_INDEX_VERSION, "title": title, "headings": headings, "elements": elements}
+
+
+# ---------- cache by content hash ----------
+
+def locator_index_path(content_hash: str) -> str:
+    return os.path.join(LOCATORS_DIR, f"{content_hash}-{DOM_INDEX_VERSION}.json")
+
+
+def load_locator_index(html_path: str, content_hash: str = None) -> Dict[str, Any]:
+    """
+    Locator index of an HTML file: from memory or disk when this content was
+    indexed before, else parsed now and saved. Pass content_hash if known.
+    """
+    content_hash = content_hash or file_sha256(html_path)
+    index = locator_index_cache.get(content_hash)
+    if index is not None:
+        return index
+
+    path = locator_index_path(content_hash)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    else:
+        with open(html_path, "r", encoding="utf-8", errors="ignore") as f:
+            index = build_locator_index(f.read())
+        os.makedirs(LOCATORS_DIR, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+
+    locator_index_cache.put(content_hash, index)
+    return index
+
+
+# ---------- selecting per test case ----------
+
+def _words(text: str) -> set:
+    # camelCase and snake/kebab-case identifiers split into words
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    return {w for w in WORD.findall(text.lower()) if w not in STOP_WORDS}
+
+
+def _element_words(el: Dict[str, Any]) -> set:
+    fields = ("id", "name", "label", "placeholder", "text", "value", "type", "role")
+    return _words(" ".join(str(el[f]) for f in fields if el.get(f)))
+
+
+def test_case_words(test_case: Dict[str, Any]) -> set:
+    steps = test_case.get("steps") or []
+    if isinstance(steps, str):
+        steps = [steps]
+    parts = [str(test_case.get("input", "")), str(test_case.get("expected_output", ""))] + [str(s) for s in steps]
+    return _words(" ".join(parts))
+
+
+def relevant_elements(index: Dict[str, Any], test_case: Dict[str, Any],
+                      limit: int = None) -> List[Dict[str, Any]]:
+    """
+    Elements of the page the test case refers to, best matches first.
+    Submit buttons of the matched elements' forms are always included.
+    Falls back to the first elements of the page when nothing matches.
+    """
+    limit = limit or MAX_PROMPT_ELEMENTS
+    elements = index.get("elements", [])
+    wanted = test_case_words(test_case)
+
+    scored = []
+    for position, el in enumerate(elements):
+        overlap = len(wanted & _element_words(el))
+        if overlap:
+            scored.append((-overlap, position, el))
+    scored.sort(key=lambda s: (s[0], s[1]))
+    picked = [el for _, _, el in scored[:limit]]
+
+    forms = {el.get("form") for el in picked if el.get("form")}
+    for el in elements:
+        if len(picked) >= limit:
+            break
+        submits = el.get("type") == "submit" or (el["tag"] == "button" and not el.get("type"))
+        if submits and el.get("form") in forms and el not in picked:
+            picked.append(el)
+
+    if not picked:
+        picked = [el for el in elements if el["tag"] != "form"][:limit]
+
+    # Keep page order, so related fields stay next to each other
+    order = {id(el): i for i, el in enumerate(elements)}
+    return sorted(picked, key=lambda el: order[id(el)])
+
+
+def format_locators(elements: List[Dict[str, Any]]) -> str:
+    """One line per element: what it is, then its selectors."""
+    lines = []
+    for el in elements:
+        kind = el["tag"] + (f"[type={el['type']}]" if el.get("type") else "")
+        details = [
+            f'{key}="{el[key]}"' for key in ("id", "role", "label", "placeholder", "text", "value", "name", "form")
+            if el.get(key)
+        ]
+        if el.get("options"):
+            details.append("options=" + "|".join(el["options"]))
+        lines.append(f"- {' '.join([kind] + details)}\n  css: {el['css']}\n  xpath: {el['xpath']}")
+    return "\n".join(lines)
+
+
+# ---------- pages ----------
+
+def page_hash(path: str) -> str:
+    # Pages are only re-hashed when they change on disk
+    return cached_file_sha256(path)
+
+
+def list_pages(html_dir: str = "data/html") -> List[Dict[str, Any]]:
+    """Every uploaded HTML page as {"path", "name", "hash"}, sorted by name."""
+    if not os.path.exists(html_dir):
+        return []
+    return [
+        {"path": os.path.join(html_dir, name), "name": name, "hash": page_hash(os.path.join(html_dir, name))}
+        for name in sorted(os.listdir(html_dir)) if name.endswith(".html")
+    ]
+
+
+def page_words(name: str, locators: Optional[Dict[str, Any]]) -> set:
+    """Words a page is recognised by: file name, title, headings and element words."""
+    locators = locators or {}
+    words = _words(" ".join([os.path.splitext(name)[0], locators.get("title", "")] + locators.get("headings", [])))
+    for el in locators.get("elements", []):
+        words |= _element_words(el)
+    return words
+
+
+def _routing_entry(page: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        locators = load_locator_index(page["path"], page["hash"])
+    except Exception as e:
+        print(f"Error indexing HTML {page['path']}: {e}")
+        locators = None
+    return {
+        "hash": page["hash"],
+        "title": (locators or {}).get("title", ""),
+        "elements": len((locators or {}).get("elements", [])),
+        "words": sorted(page_words(page["name"], locators))
+    }
+
+
+# routing file -> (html_dir mtime_ns, routing): uploads replace pages atomically, which touches the directory
+_routings: Dict[str, tuple] = {}
+_routing_lock = threading.Lock()
+
+
+def load_page_routing(html_dir: str, routing_path: str, refresh: bool = False) -> Dict[str, Any]:
+    """
+    Routing index of a project's pages: {"pages": [{"path", "name", "hash", "title", "elements"}],
+    "words": {word: [page positions]}}. Stored per page content hash in routing_path, so only
+    pages added or changed since it was written have their locator index loaded; other
+    requests neither parse nor load any locator index. refresh re-checks every page's hash.
+    """
+    stamp = os.stat(html_dir).st_mtime_ns if os.path.exists(html_dir) else None
+    known = _routings.get(routing_path)
+    if not refresh and known is not None and known[0] == stamp:
+        return known[1]
+
+    with _routing_lock:
+        return _load_page_routing(html_dir, routing_path, stamp)
+
+
+def _load_page_routing(html_dir: str, routing_path: str, stamp) -> Dict[str, Any]:
+    stored = {}
+    if os.path.exists(routing_path):
+        try:
+            with open(routing_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") == DOM_INDEX_VERSION:
+                stored = saved["pages"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error loading page routing, rebuilding: {e}")
+
+    entries = {}
+    for page in list_pages(html_dir):
+        entry = stored.get(page["name"])
+        if entry is None or entry["hash"] != page["hash"]:
+            entry = _routing_entry(page)
+        entries[page["name"]] = entry
+
+    if entries != stored:
+        tmp_path = routing_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": DOM_INDEX_VERSION, "pages": entries}, f)
+        os.replace(tmp_path, routing_path)
+
+    pages, words = [], {}
+    for position, name in enumerate(sorted(entries)):
+        entry = entries[name]
+        pages.append({"path": os.path.join(html_dir, name), "name": name, "hash": entry["hash"],
+                      "title": entry["title"], "elements": entry["elements"]})
+        for word in entry["words"]:
+            words.setdefault(word, []).append(position)
+    routing = {"pages": pages, "words": words}
+    _routings[routing_path] = (stamp, routing)
+    return routing
+
+
+def route_pages(test_case: Dict[str, Any], routing: Dict[str, Any],
+                limit: int = None) -> List[Dict[str, Any]]:
+    """
+    Pages a test case runs on. An explicit "page" field (file name) wins;
+    otherwise pages are ranked by how many of the test case's words they
+    contain (looked up in the routing index), keeping up to `limit`.
+    Falls back to the first page.
+    """
+    pages = routing["pages"]
+    if not pages:
+        return []
+
+    named = os.path.basename(str(test_case.get("page") or "")).lower()
+    if named:
+        for page in pages:
+            if page["name"].lower() in (named, named + ".html"):
+                return [page]
+
+    scores = {}
+    for word in test_case_words(test_case):
+        for position in routing["words"].get(word, ()):
+            scores[position] = scores.get(position, 0) + 1
+    scored = sorted(scores.items(), key=lambda s: (-s[1], s[0]))
+    if not scored:
+        return [pages[0]]
+
+    # A second page only joins when it matches about as well as the best one
+    best = scored[0][1]
+    return [pages[i] for i, score in scored[:limit or MAX_PAGES_PER_CASE] if score * 2 >= best]
@@ -0,0 +1,176 @@
+import os
+import math
+import faiss
+import numpy as np
+
+# "flat" is the exact brute-force baseline; the others are approximate
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "hnsw"]
+
+# Default for new builds: one of INDEX_TYPES, or "auto" to pick by chunk count
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto")
+
+# auto: exact search below FLAT_MAX_CHUNKS, IVF-Flat above. IVF-PQ is never picked
+# automatically: its compressed codes cap recall (~0.5 at recall@6), so it is opt-in
+FLAT_MAX_CHUNKS = int(os.getenv("FLAT_MAX_CHUNKS", "20000"))
+
+# Query-time defaults, overridable per search_vector_db call
+DEFAULT_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+DEFAULT_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "128"))
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+PQ_NBITS = 8
+
+# Training vectors per IVF list (faiss warns below ~39)
+TRAIN_POINTS_PER_LIST = 50
+MAX_TRAIN_SAMPLE = int(os.getenv("FAISS_MAX_TRAIN_SAMPLE", "100000"))
+
+
+def resolve_index_type(num_chunks: int, index_type: str = None) -> str:
+    """
+    Turn "auto" (or None) into a concrete index type for num_chunks.
+    IVF types fall back to a simpler type while there are too few chunks to train them.
+    """
+    index_type = index_type or FAISS_INDEX_TYPE
+
+    if index_type != "auto":
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}'. Use one of {INDEX_TYPES} or 'auto'.")
+        if index_type == "ivf_pq" and num_chunks < (1 << PQ_NBITS) * TRAIN_POINTS_PER_LIST:
+            index_type = "ivf_flat"
+        if index_type == "ivf_flat" and num_chunks < 2 * TRAIN_POINTS_PER_LIST:
+            index_type = "flat"
+        return index_type
+
+    if num_chunks < FLAT_MAX_CHUNKS:
+        return "flat"
+    return "ivf_flat"
+
+
+def num_lists(num_chunks: int) -> int:
+    """IVF list count: ~4·sqrt(n), capped so every list gets enough training points."""
+    nlist = int(4 * math.sqrt(max(num_chunks, 1)))
+    return max(1, min(nlist, num_chunks // TRAIN_POINTS_PER_LIST))
+
+
+def pq_subquantizers(dimension: int) -> int:
+    """Largest sub-quantizer count ≤ 48 that divides the dimension."""
+    for m in range(min(48, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def make_index(index_type: str, dimension: int, num_chunks: int):
+    """
+    Empty index of the given type. Every returned index accepts add_with_ids:
+    IVF indexes carry ids natively, flat and HNSW are wrapped in IndexIDMap2.
+    """
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return faiss.IndexIDMap2(hnsw)
+
+    quantizer = faiss.IndexFlatL2(dimension)
+    nlist = num_lists(num_chunks)
+
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    elif index_type == "ivf_pq":
+        index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_subquantizers(dimension), PQ_NBITS)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}'")
+
+    return index
+
+
+def training_size(index_type: str, num_chunks: int) -> int:
+    """How many vectors to sample for training (0 if the type needs none)."""
+    if index_type not in ("ivf_flat", "ivf_pq"):
+        return 0
+    wanted = num_lists(num_chunks) * TRAIN_POINTS_PER_LIST
+    if index_type == "ivf_pq":
+        wanted = max(wanted, (1 << PQ_NBITS) * TRAIN_POINTS_PER_LIST)
+    return min(wanted, num_chunks, MAX_TRAIN_SAMPLE)
+
+
+def index_kind(index) -> str:
+    """Which of INDEX_TYPES a loaded index is."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def supports_remove(index_type: str) -> bool:
+    """HNSW graphs cannot drop vectors; they are rebuilt from stored rows instead."""
+    return index_type != "hnsw"
+
+
+def supports_selector(index_type: str) -> bool:
+    """HNSW behind IndexIDMap2 ignores id selectors; its results are filtered afterwards instead."""
+    return index_type != "hnsw"
+
+
+def search_params(index_type: str, nprobe: int = None, ef_search: int = None, sel=None):
+    """
+    Per-query search parameters, so concurrent queries can use different settings.
+    sel is an optional faiss.IDSelector restricting which ids can be returned.
+    """
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or DEFAULT_NPROBE, sel=sel)
+    if index_type == "hnsw":
+        return faiss.SearchParametersHNSW(efSearch=ef_search or DEFAULT_EF_SEARCH)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def sample_rows(row_blocks, total: int, size: int, seed: int = 0) -> np.ndarray:
+    """
+    Uniform sample of `size` rows from an iterable of row blocks holding
+    `total` rows in all, without concatenating the blocks.
+    """
+    rng = np.random.default_rng(seed)
+    wanted = np.sort(rng.choice(total, size=size, replace=False))
+
+    picked = []
+    offset = 0
+    for block in row_blocks:
+        lo = np.searchsorted(wanted, offset)
+        hi = np.searchsorted(wanted, offset + len(block))
+        if hi > lo:
+            picked.append(block[wanted[lo:hi] - offset])
+        offset += len(block)
+
+    return np.vstack(picked).astype("float32")
+
+
+def build_index(index_type: str, blocks, total: int):
+    """
+    Build an index of index_type from (ids, rows) blocks.
+    `blocks` is a callable returning a fresh iterator of blocks, since
+    training needs a first pass over the rows to draw its sample.
+    """
+    first = next(iter(blocks()), None)
+    if first is None or not total:
+        return None
+
+    index = make_index(index_type, first[1].shape[1], total)
+
+    n_train = training_size(index_type, total)
+    if n_train:
+        index.train(sample_rows((rows for _, rows in blocks()), total, n_train))
+
+    for ids, rows in blocks():
+        index.add_with_ids(rows, ids)
+
+    return index
@@ -0,0 +1,147 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from collections import OrderedDict, deque
+from typing import Dict, Any, Callable, Optional
+
+# Builds submitted within this many seconds of each other run as one
+BUILD_DEBOUNCE = float(os.getenv("BUILD_DEBOUNCE", "1.0"))
+# Finished jobs kept for status polling
+MAX_BUILD_JOBS = int(os.getenv("MAX_BUILD_JOBS", "100"))
+
+# Job records are plain dicts, safe to return from the API as they are:
+#   {"id", "key", "status": queued|running|done|failed, "stage", "progress": {"done", "total"},
+#    "submissions", "created", "started", "finished", "result", "error"}
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+# job id -> (build callable, threading.Event set when it finishes)
+_runtime: Dict[str, tuple] = {}
+# key -> id of the queued job that new submissions join
+_pending: Dict[str, str] = {}
+_queue = deque()
+_lock = threading.Condition()
+_worker = None
+
+
+def submit_build(build: Callable[[Callable], Dict[str, Any]], key: str = "default") -> Dict[str, Any]:
+    """
+    Queue a knowledge-base build and return its job record.
+    build(progress) runs on the single build thread; it reports through
+    progress(stage, done=0, total=0) and returns the job result.
+    While a job for `key` is still queued, further submissions join it
+    (the latest build callable wins) instead of queuing another rebuild.
+    """
+    _ensure_worker()
+    now = time.time()
+
+    with _lock:
+        job_id = _pending.get(key)
+        if job_id is not None:
+            job = _jobs[job_id]
+            job["submissions"] += 1
+            job["last_submitted"] = now
+            _runtime[job_id] = (build, _runtime[job_id][1])
+            return dict(job)
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "id": job_id,
+            "key": key,
+            "status": "queued",
+            "stage": None,
+            "progress": {"done": 0, "total": 0},
+            "submissions": 1,
+            "created": now,
+            "last_submitted": now,
+            "started": None,
+            "finished": None,
+            "result": None,
+            "error": None
+        }
+        _jobs[job_id] = job
+        _runtime[job_id] = (build, threading.Event())
+        _pending[key] = job_id
+        _queue.append(job_id)
+        _trim()
+        _lock.notify_all()
+        return dict(job)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+
+def list_jobs(limit: int = 20):
+    with _lock:
+        return [dict(job) for job in list(_jobs.values())[-limit:]][::-1]
+
+
+def wait_job(job_id: str, timeout: float = None) -> Optional[Dict[str, Any]]:
+    """Block until the job has finished (or timeout); returns its record."""
+    with _lock:
+        runtime = _runtime.get(job_id)
+    if runtime is not None:
+        runtime[1].wait(timeout)
+    return get_job(job_id)
+
+
+def _trim():
+    """Forget the oldest finished jobs beyond MAX_BUILD_JOBS."""
+    finished = [j for j, job in _jobs.items() if job["status"] in ("done", "failed")]
+    for job_id in finished[:max(0, len(_jobs) - MAX_BUILD_JOBS)]:
+        _jobs.pop(job_id)
+        _runtime.pop(job_id, None)
+
+
+def _ensure_worker():
+    global _worker
+    with _lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="kb-build", daemon=True)
+            _worker.start()
+
+
+def _progress(job_id: str):
+    def report(stage: str, done: int = 0, total: int = 0):
+        with _lock:
+            job = _jobs[job_id]
+            job["stage"] = stage
+            job["progress"] = {"done": done, "total": total}
+    return report
+
+
+def _run():
+    """Build thread: one build at a time, each after its debounce window has passed."""
+    while True:
+        with _lock:
+            while not _queue:
+                _lock.wait()
+            job_id = _queue[0]
+            job = _jobs[job_id]
+            delay = job["last_submitted"] + BUILD_DEBOUNCE - time.time()
+            if delay > 0:
+                _lock.wait(delay)
+                continue
+
+            _queue.popleft()
+            _pending.pop(job["key"], None)
+            job["status"] = "running"
+            job["started"] = time.time()
+            build, done_event = _runtime[job_id]
+
+        try:
+            result, error, status = build(_progress(job_id)), None, "done"
+        except Exception as e:
+            traceback.print_exc()
+            result, error, status = None, f"{type(e).__name__}: {e}", "failed"
+
+        with _lock:
+            job["status"] = status
+            job["result"] = result
+            job["error"] = error
+            job["finished"] = time.time()
+            _trim()
+        done_event.set()
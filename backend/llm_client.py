@@ -0,0 +1,379 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from typing import Dict, Any
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from backend.cache import ResponseCache
+from backend.llm_providers import resolve_model, empty_usage, status as providers_status
+from backend.metrics import record_stage, LLM_CALLS, LLM_RETRIES, LLM_TOKENS
+
+# At most this many LLM calls are in flight across the whole process. Every
+# caller goes through this client, so per-request fan-out settings (batch
+# workers) and connection pools only shape traffic below this cap
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Deadline per attempt, in seconds
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+# Deadline for a whole call, attempts and backoff sleeps included
+LLM_TOTAL_TIMEOUT = float(os.getenv("LLM_TOTAL_TIMEOUT", str(2 * LLM_TIMEOUT)))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# google.api_core exception names worth retrying (rate limits, overload, transient 5xx)
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable",
+    "InternalServerError", "DeadlineExceeded", "GatewayTimeout", "TimeoutError",
+    # httpx, for OpenAI-compatible servers
+    "ConnectError", "ConnectTimeout", "ReadTimeout", "PoolTimeout", "RemoteProtocolError"
+}
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+# Identical model + config + prompt are answered from disk instead of the model
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite")
+llm_response_cache = ResponseCache(
+    LLM_CACHE_PATH,
+    ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+)
+
+
+# ---------- models ----------
+
+# Model per task: a bare model name (served by LLM_PROVIDER) or "provider:model",
+# e.g. SELENIUM_MODEL=openai:qwen2.5-coder-7b for a local inference server
+TASK_MODELS = {
+    "test_cases": os.getenv("TEST_CASE_MODEL", "gemini-2.0-flash"),
+    "selenium": os.getenv("SELENIUM_MODEL", "gemini-2.0-flash"),
+    "llm_test": os.getenv("LLM_TEST_MODEL", "gemini-2.5-flash")
+}
+
+
+def task_model(task: str) -> str:
+    return TASK_MODELS[task]
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if type(error).__name__ in RETRYABLE_ERRORS:
+        return True
+    return getattr(error, "code", None) in RETRYABLE_CODES
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def attempt_timeout(timeout: float, call_deadline: float, loop) -> float:
+    """An attempt's own timeout, cut short by what is left of the whole call's deadline."""
+    return max(0, min(timeout, call_deadline - loop.time()))
+
+
+# ---------- shared event loop ----------
+
+# Every call runs on one background loop, so sync handlers (thread pool) and
+# async handlers share the same semaphore and in-flight limit.
+_loop = None
+_semaphore = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _semaphore
+
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                _semaphore = asyncio.run_coroutine_threadsafe(_make_semaphore(), loop).result()
+                _loop = loop
+
+    return _loop
+
+
+async def _make_semaphore():
+    return asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+
+# ---------- per-call stats ----------
+
+_stats_lock = threading.Lock()
+_totals = {"calls": 0, "errors": 0, "retries": 0, "cache_hits": 0,
+           "prompt_tokens": 0, "output_tokens": 0, "latency_seconds": 0.0}
+recent_calls = deque(maxlen=200)
+# Only touched on the client loop
+_in_flight = [0]
+
+
+def _record(result: Dict[str, Any]):
+    with _stats_lock:
+        _totals["calls"] += 1
+        _totals["errors"] += 1 if result["error"] else 0
+        _totals["retries"] += max(0, result["attempts"] - 1)
+        _totals["cache_hits"] += 1 if result["cached"] else 0
+        _totals["prompt_tokens"] += result["usage"]["prompt_tokens"]
+        _totals["output_tokens"] += result["usage"]["output_tokens"]
+        _totals["latency_seconds"] += result["latency"]
+        recent_calls.append({k: v for k, v in result.items() if k != "text"})
+
+    model = result["model"]
+    record_stage("llm_cache" if result["cached"] else "llm", result["latency"])
+    LLM_CALLS.inc(model=model, outcome="error" if result["error"] else "cached" if result["cached"] else "ok")
+    LLM_RETRIES.inc(max(0, result["attempts"] - 1), model=model)
+    LLM_TOKENS.inc(result["usage"]["prompt_tokens"], model=model, direction="prompt")
+    LLM_TOKENS.inc(result["usage"]["output_tokens"], model=model, direction="output")
+
+
+def llm_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        totals = dict(_totals)
+        recent = list(recent_calls)
+    totals["latency_seconds"] = round(totals["latency_seconds"], 4)
+    totals["in_flight"] = _in_flight[0]
+    totals["max_concurrency"] = LLM_MAX_CONCURRENCY
+    return {"totals": totals, "recent": recent[-20:]}
+
+
+def status():
+    return providers_status()
+
+
+# ---------- calls ----------
+
+async def _call(model_name: str, prompt: str, generation_config: dict,
+                timeout: float, retries: int, total_timeout: float) -> Dict[str, Any]:
+    """
+    One logical call on the shared loop: semaphore, deadline per attempt, retries.
+    No attempt runs past total_timeout, and no retry starts once its backoff would reach it.
+    """
+    loop = asyncio.get_running_loop()
+    call_deadline = loop.time() + total_timeout
+    started = time.perf_counter()
+    attempts = 0
+    error = None
+    text = ""
+    usage = empty_usage()
+
+    while True:
+        attempts += 1
+        try:
+            async with _semaphore:
+                _in_flight[0] += 1
+                try:
+                    provider, name = resolve_model(model_name)
+                    text, usage = await asyncio.wait_for(
+                        provider.generate(name, prompt, generation_config),
+                        timeout=attempt_timeout(timeout, call_deadline, loop)
+                    )
+                finally:
+                    _in_flight[0] -= 1
+            error = None
+            break
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            if attempts > retries or not is_retryable(e):
+                break
+            delay = backoff_delay(attempts - 1)
+            if loop.time() + delay >= call_deadline:
+                break
+            await asyncio.sleep(delay)
+
+    return {
+        "model": model_name,
+        "text": text,
+        "error": error,
+        "cached": False,
+        "attempts": attempts,
+        "latency": round(time.perf_counter() - started, 4),
+        "usage": usage
+    }
+
+
+async def agenerate(model_name: str, prompt: str, generation_config: dict, use_cache: bool = True,
+                    timeout: float = None, retries: int = None, total_timeout: float = None) -> Dict[str, Any]:
+    """
+    Generate with model_name. Returns {"text", "error", "cached", "attempts",
+    "latency", "usage"}; "error" is set instead of raising. Identical model +
+    config + prompt are served from the response cache unless use_cache=False.
+    """
+    started = time.perf_counter()
+    key = ResponseCache.make_key(model_name, generation_config, prompt)
+
+    if use_cache:
+        # SQLite I/O runs off the event loop
+        cached = await asyncio.to_thread(llm_response_cache.get, key)
+        if cached is not None:
+            result = {
+                "model": model_name, "text": cached, "error": None, "cached": True, "attempts": 0,
+                "latency": round(time.perf_counter() - started, 4), "usage": empty_usage()
+            }
+            _record(result)
+            return result
+
+    call = _call(
+        model_name, prompt, generation_config,
+        LLM_TIMEOUT if timeout is None else timeout,
+        LLM_MAX_RETRIES if retries is None else retries,
+        LLM_TOTAL_TIMEOUT if total_timeout is None else total_timeout
+    )
+    loop = get_loop()
+    if asyncio.get_running_loop() is loop:
+        result = await call
+    else:
+        result = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(call, loop))
+
+    # Empty responses are never cached
+    if use_cache and not result["error"] and result["text"].strip():
+        await asyncio.to_thread(llm_response_cache.put, key, model_name, result["text"])
+
+    _record(result)
+    return result
+
+
+def generate(model_name: str, prompt: str, generation_config: dict, use_cache: bool = True,
+             timeout: float = None, retries: int = None, total_timeout: float = None) -> Dict[str, Any]:
+    """Blocking form of agenerate() for sync callers (FastAPI thread pool, scripts)."""
+    future = asyncio.run_coroutine_threadsafe(
+        agenerate(model_name, prompt, generation_config, use_cache, timeout, retries, total_timeout),
+        get_loop()
+    )
+    return future.result()
+
+
+# ---------- streaming ----------
+
+_STREAM_DONE = object()
+
+
+async def _stream(model_name: str, prompt: str, generation_config: dict,
+                  timeout: float, retries: int, total_timeout: float, emit) -> Dict[str, Any]:
+    """
+    Streaming form of _call(): emit(text) is called for every delta as it
+    arrives. The per-attempt deadline covers the whole stream (within the
+    call's total_timeout, as in _call()); retries only happen
+    before the first delta, since emitted text cannot be taken back.
+    """
+    loop = asyncio.get_running_loop()
+    call_deadline = loop.time() + total_timeout
+    started = time.perf_counter()
+    attempts = 0
+    error = None
+    parts = []
+    usage = empty_usage()
+    first_latency = None
+
+    while True:
+        attempts += 1
+        try:
+            async with _semaphore:
+                deadline = loop.time() + attempt_timeout(timeout, call_deadline, loop)
+                provider, name = resolve_model(model_name)
+                chunks = provider.stream(name, prompt, generation_config)
+                _in_flight[0] += 1
+                try:
+                    while True:
+                        try:
+                            text, chunk_usage = await asyncio.wait_for(
+                                chunks.__anext__(), timeout=max(0, deadline - loop.time())
+                            )
+                        except StopAsyncIteration:
+                            break
+                        if chunk_usage is not None:
+                            usage = chunk_usage
+                        if text:
+                            if first_latency is None:
+                                first_latency = round(time.perf_counter() - started, 4)
+                            parts.append(text)
+                            emit(text)
+                finally:
+                    _in_flight[0] -= 1
+                    # Releases the provider's connection on errors and timeouts too
+                    await chunks.aclose()
+            error = None
+            break
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+            if parts or attempts > retries or not is_retryable(e):
+                break
+            delay = backoff_delay(attempts - 1)
+            if loop.time() + delay >= call_deadline:
+                break
+            await asyncio.sleep(delay)
+
+    return {
+        "model": model_name,
+        "text": "".join(parts),
+        "error": error,
+        "cached": False,
+        "attempts": attempts,
+        "latency": round(time.perf_counter() - started, 4),
+        "first_token_latency": first_latency,
+        "usage": usage
+    }
+
+
+async def astream(model_name: str, prompt: str, generation_config: dict, use_cache: bool = True,
+                  timeout: float = None, retries: int = None, total_timeout: float = None):
+    """
+    Async generator over the model's streaming API: yields text deltas as
+    they arrive, then the client result dict (as from agenerate(), plus
+    "first_token_latency"). A cached response is yielded as a single delta.
+    """
+    started = time.perf_counter()
+    key = ResponseCache.make_key(model_name, generation_config, prompt)
+
+    if use_cache:
+        cached = await asyncio.to_thread(llm_response_cache.get, key)
+        if cached is not None:
+            latency = round(time.perf_counter() - started, 4)
+            result = {
+                "model": model_name, "text": cached, "error": None, "cached": True, "attempts": 0,
+                "latency": latency, "first_token_latency": latency, "usage": empty_usage()
+            }
+            _record(result)
+            yield cached
+            yield result
+            return
+
+    # Deltas are handed from the client loop to this loop through a queue
+    caller = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    call = _stream(
+        model_name, prompt, generation_config,
+        LLM_TIMEOUT if timeout is None else timeout,
+        LLM_MAX_RETRIES if retries is None else retries,
+        LLM_TOTAL_TIMEOUT if total_timeout is None else total_timeout,
+        lambda text: caller.call_soon_threadsafe(queue.put_nowait, text)
+    )
+    loop = get_loop()
+    if caller is loop:
+        future = asyncio.ensure_future(call)
+    else:
+        future = asyncio.wrap_future(asyncio.run_coroutine_threadsafe(call, loop))
+    future.add_done_callback(lambda _: queue.put_nowait(_STREAM_DONE))
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_DONE:
+                break
+            yield item
+    finally:
+        # The consumer went away (e.g. client disconnected): stop the model call too
+        if not future.done():
+            future.cancel()
+
+    result = future.result()
+    if use_cache and not result["error"] and result["text"].strip():
+        await asyncio.to_thread(llm_response_cache.put, key, model_name, result["text"])
+
+    _record(result)
+    yield result
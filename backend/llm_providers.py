@@ -0,0 +1,237 @@
+import os
+import json
+import threading
+from typing import Dict, Any, Tuple
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# Provider for model names without a "provider:" prefix
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+# OpenAI-compatible chat completions server (vLLM, llama.cpp, Ollama, TGI, ...)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "http://localhost:8080/v1")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+# Pooled keep-alive connections to it
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+
+class ProviderError(RuntimeError):
+    """A provider answered with an error status; `code` is the HTTP status."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"HTTP {code}: {message}")
+        self.code = code
+
+
+def empty_usage() -> Dict[str, int]:
+    return {"prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0}
+
+
+# ---------- Gemini ----------
+
+def response_text(response) -> str:
+    """Joined text parts of the first candidate ("" if there are none)."""
+    try:
+        if hasattr(response, "candidates") and response.candidates:
+            candidate = response.candidates[0]
+            if hasattr(candidate, "content") and hasattr(candidate.content, "parts"):
+                return "\n".join(
+                    part.text for part in candidate.content.parts
+                    if hasattr(part, "text") and part.text
+                )
+    except Exception:
+        pass
+    return ""
+
+
+def response_usage(response) -> Dict[str, int]:
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "total_tokens": getattr(usage, "total_token_count", 0) or 0
+    }
+
+
+class GeminiProvider:
+    """
+    google.generativeai, configured on first use (so the service starts
+    without credentials), with one shared GenerativeModel per model name.
+    """
+
+    name = "gemini"
+
+    def __init__(self):
+        self.genai = None
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def configure(self):
+        """Import and configure the Gemini SDK once. Raises if the key is missing."""
+        if self.genai is None:
+            with self.lock:
+                if self.genai is None:
+                    api_key = os.getenv("GEMINI_API_KEY")
+                    if not api_key:
+                        raise RuntimeError("GEMINI_API_KEY not set in environment variables.")
+                    import google.generativeai as genai
+                    genai.configure(api_key=api_key)
+                    self.genai = genai
+        return self.genai
+
+    def model(self, model_name: str):
+        if model_name not in self.models:
+            genai = self.configure()
+            with self.lock:
+                if model_name not in self.models:
+                    self.models[model_name] = genai.GenerativeModel(model_name)
+        return self.models[model_name]
+
+    async def generate(self, model_name: str, prompt: str, config: dict) -> Tuple[str, Dict[str, int]]:
+        response = await self.model(model_name).generate_content_async(prompt, generation_config=config)
+        return response_text(response), response_usage(response)
+
+    async def stream(self, model_name: str, prompt: str, config: dict):
+        """Yields (text delta, usage or None) per streamed chunk."""
+        response = await self.model(model_name).generate_content_async(prompt, generation_config=config, stream=True)
+        async for chunk in response:
+            usage = response_usage(chunk) if getattr(chunk, "usage_metadata", None) is not None else None
+            yield response_text(chunk), usage
+
+    def loaded(self):
+        return sorted(self.models)
+
+
+# ---------- OpenAI-compatible HTTP ----------
+
+def chat_request(model_name: str, prompt: str, config: dict) -> Dict[str, Any]:
+    """Chat completions body for a Gemini-style generation config."""
+    body = {"model": model_name, "messages": [{"role": "user", "content": prompt}]}
+    if "temperature" in config:
+        body["temperature"] = config["temperature"]
+    if "top_p" in config:
+        body["top_p"] = config["top_p"]
+    if "max_output_tokens" in config:
+        body["max_tokens"] = config["max_output_tokens"]
+    if config.get("response_mime_type") == "application/json":
+        body["response_format"] = {"type": "json_object"}
+    return body
+
+
+def chat_usage(data: Dict[str, Any]) -> Dict[str, int]:
+    usage = data.get("usage") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", 0) or 0,
+        "output_tokens": usage.get("completion_tokens", 0) or 0,
+        "total_tokens": usage.get("total_tokens", 0) or 0
+    }
+
+
+class OpenAICompatibleProvider:
+    """
+    /chat/completions over HTTP, for self-hosted inference servers. One
+    httpx.AsyncClient (keep-alive connection pool) is shared by every call;
+    it is created on first use, on the LLM client loop that all calls run on.
+    """
+
+    name = "openai"
+
+    def __init__(self, base_url: str = None, api_key: str = None, max_connections: int = None):
+        self.base_url = (base_url or OPENAI_BASE_URL).rstrip("/")
+        self.api_key = OPENAI_API_KEY if api_key is None else api_key
+        self.max_connections = max_connections or OPENAI_MAX_CONNECTIONS
+        self.client = None
+        self.used_models = set()
+
+    def http(self):
+        if self.client is None:
+            import httpx
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                # Deadlines are enforced by the LLM client per attempt
+                timeout=None,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections)
+            )
+        return self.client
+
+    async def generate(self, model_name: str, prompt: str, config: dict) -> Tuple[str, Dict[str, int]]:
+        self.used_models.add(model_name)
+        response = await self.http().post("/chat/completions", json=chat_request(model_name, prompt, config))
+        if response.status_code >= 400:
+            raise ProviderError(response.status_code, response.text[:500])
+        data = response.json()
+        choices = data.get("choices") or [{}]
+        return (choices[0].get("message") or {}).get("content") or "", chat_usage(data)
+
+    async def stream(self, model_name: str, prompt: str, config: dict):
+        """Yields (text delta, usage or None) per server-sent chunk."""
+        self.used_models.add(model_name)
+        body = {**chat_request(model_name, prompt, config), "stream": True,
+                "stream_options": {"include_usage": True}}
+        async with self.http().stream("POST", "/chat/completions", json=body) as response:
+            if response.status_code >= 400:
+                raise ProviderError(response.status_code, (await response.aread()).decode("utf-8", "replace")[:500])
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                data = json.loads(payload)
+                choices = data.get("choices") or [{}]
+                text = (choices[0].get("delta") or {}).get("content") or ""
+                yield text, chat_usage(data) if data.get("usage") else None
+
+    def loaded(self):
+        return sorted(self.used_models)
+
+
+# ---------- registry ----------
+
+PROVIDER_TYPES = {
+    "gemini": GeminiProvider,
+    "openai": OpenAICompatibleProvider
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def register_provider(name: str, provider):
+    """Use `provider` for "name:model" specs (and plain names if name is LLM_PROVIDER)."""
+    with _providers_lock:
+        _providers[name] = provider
+        PROVIDER_TYPES.setdefault(name, type(provider))
+
+
+def get_provider(name: str):
+    """The shared provider instance for name, created on first use."""
+    if name not in _providers:
+        if name not in PROVIDER_TYPES:
+            raise ValueError(f"Unknown LLM provider '{name}' (known: {', '.join(sorted(PROVIDER_TYPES))})")
+        with _providers_lock:
+            if name not in _providers:
+                _providers[name] = PROVIDER_TYPES[name]()
+    return _providers[name]
+
+
+def resolve_model(spec: str):
+    """
+    "provider:model" or a bare model name for LLM_PROVIDER -> (provider, model).
+    Only a known provider prefix is split off, so "llama3:8b" stays a model name.
+    """
+    prefix, sep, rest = spec.partition(":")
+    if sep and prefix in PROVIDER_TYPES:
+        return get_provider(prefix), rest
+    return get_provider(LLM_PROVIDER), spec
+
+
+def status():
+    with _providers_lock:
+        providers = dict(_providers)
+    models = sorted(f"{name}:{model}" for name, p in providers.items() for model in p.loaded())
+    return {"llm": bool(models), "llm_models": models}
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+from typing import Dict, Any
+
+MANIFEST_PATH = "data/manifest.json"
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a file, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# path -> (mtime_ns, size, sha256): files are only re-hashed when they change on disk
+_file_hashes: Dict[str, tuple] = {}
+
+
+def cached_file_sha256(path: str) -> str:
+    """file_sha256(), reused while the file's mtime and size are unchanged."""
+    st = os.stat(path)
+    known = _file_hashes.get(path)
+    if known is None or known[:2] != (st.st_mtime_ns, st.st_size):
+        known = (st.st_mtime_ns, st.st_size, file_sha256(path))
+        _file_hashes[path] = known
+    return known[2]
+
+
+def remember_file_sha256(path: str, digest: str):
+    """Record the hash of a file just written, whose content is known without reading it back."""
+    st = os.stat(path)
+    _file_hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+
+
+def empty_manifest() -> Dict[str, Any]:
+    return {"next_id": 0, "files": {}}
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    """
+    Load the per-file manifest of the knowledge base.
+    Layout: {"next_id": int, "files": {path: {"hash", "doc_type", "chunk_ids", "signature", "rows"}}}
+    """
+    if not os.path.exists(path):
+        return empty_manifest()
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error loading manifest, starting fresh: {e}")
+        return empty_manifest()
+
+    manifest.setdefault("next_id", 0)
+    manifest.setdefault("files", {})
+    return manifest
+
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH):
+    """Write the manifest atomically (temp file + rename)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def diff_sources(manifest: Dict[str, Any], hashes: Dict[str, str], signature: str = None) -> Dict[str, list]:
+    """
+    Compare current source files {path: hash} with the manifest.
+    A file also counts as changed when it was chunked/embedded under another signature.
+    Returns lists of added, changed, removed and unchanged paths.
+    """
+    known = manifest["files"]
+    added, changed, unchanged = [], [], []
+
+    for path, digest in hashes.items():
+        if path not in known:
+            added.append(path)
+        elif known[path]["hash"] != digest or known[path].get("signature") != signature:
+            changed.append(path)
+        else:
+            unchanged.append(path)
+
+    removed = [path for path in known if path not in hashes]
+
+    return {
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+        "unchanged": unchanged
+    }
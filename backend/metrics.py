@@ -0,0 +1,178 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple
+
+# Histogram buckets (seconds) for pipeline stages, from cached lookups to slow LLM calls
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: Tuple, extra: Tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A named metric family with one value per label set."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values = {}
+        with _registry_lock:
+            _registry[name] = self
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, key, value in self.samples():
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """Mirror a count kept elsewhere (e.g. LRUCache hits) at scrape time."""
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=STAGE_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted((key, dict(state, counts=list(state["counts"]))) for key, state in self.values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                le = (("le", _format_value(float(bound))),)
+                lines.append(f"{self.name}_bucket{_format_labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {state['count']}")
+        return "\n".join(lines)
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return "\n".join(m.render() for m in metrics) + "\n"
+
+
+# ---------- pipeline metrics ----------
+
+STAGE_SECONDS = Histogram("qa_stage_seconds", "Time spent per pipeline stage")
+HTTP_SECONDS = Histogram("qa_http_request_seconds", "HTTP request latency until the response starts")
+CHUNKS_EMBEDDED = Counter("qa_chunks_embedded_total", "Document chunks encoded by the embedding model")
+QUERIES_EMBEDDED = Counter("qa_queries_embedded_total", "Queries encoded by the embedding model (cache misses)")
+FILES_EXTRACTED = Counter("qa_files_extracted_total", "Source files extracted, by document type and outcome")
+PROMPT_CHARS = Counter("qa_prompt_characters_total", "Characters sent in LLM prompts, by task")
+PROMPT_TOKENS = Counter("qa_prompt_tokens_total", "Estimated tokens sent in LLM prompts, by task")
+PARSE_FAILURES = Counter("qa_parse_failures_total", "LLM replies that could not be used, by task")
+LLM_CALLS = Counter("qa_llm_calls_total", "LLM calls by model and outcome (ok, cached, error)")
+LLM_RETRIES = Counter("qa_llm_retries_total", "LLM call attempts beyond the first")
+LLM_TOKENS = Counter("qa_llm_tokens_total", "Tokens reported by the LLM, by model and direction")
+CACHE_HITS = Counter("qa_cache_hits_total", "Cache hits by cache")
+CACHE_MISSES = Counter("qa_cache_misses_total", "Cache misses by cache")
+CACHE_ENTRIES = Gauge("qa_cache_entries", "Entries currently held, by cache")
+LLM_IN_FLIGHT = Gauge("qa_llm_in_flight", "LLM calls currently in flight")
+
+
+# ---------- per-request timing breakdown ----------
+
+# {stage: seconds} of the request being handled, if one is being collected.
+# Worker threads (asyncio.to_thread) and tasks inherit it, so their stages add up here too.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+_timings_lock = threading.Lock()
+
+
+def start_request_timings() -> Dict[str, float]:
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def request_timings() -> Dict[str, float]:
+    """
+    Seconds per stage for the current request. Stages of concurrent calls
+    (e.g. the LLM calls of a batch) are summed, so they can exceed wall time.
+    """
+    timings = _request_timings.get()
+    with _timings_lock:
+        return {stage: round(seconds, 4) for stage, seconds in (timings or {}).items()}
+
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        with _timings_lock:
+            timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the block as one observation of `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
@@ -0,0 +1,84 @@
+import os
+import re
+from typing import Dict, List
+
+DATA_DIR = "data"
+PROJECTS_DIR = os.path.join(DATA_DIR, "projects")
+
+# Requests without a project use this knowledge base, stored in the original
+# single-project layout directly under data/
+DEFAULT_PROJECT = "default"
+
+PROJECT_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def project_name(project: str = None) -> str:
+    """Validated project id (DEFAULT_PROJECT when empty); raises ValueError."""
+    project = (project or DEFAULT_PROJECT).strip()
+    if not PROJECT_ID.match(project):
+        raise ValueError(
+            f"Invalid project id '{project}': use up to 64 letters, digits, '-' or '_'"
+        )
+    return project
+
+
+def project_root(project: str = None) -> str:
+    project = project_name(project)
+    return DATA_DIR if project == DEFAULT_PROJECT else os.path.join(PROJECTS_DIR, project)
+
+
+def kb_paths(project: str = None) -> Dict[str, str]:
+    """
+    Source directories and knowledge-base files of one project. "version" is
+    the pointer to the published snapshot; index / chunks / manifest are the
+    files of the pre-snapshot layout, read until the first snapshot is published.
+    """
+    root = project_root(project)
+    return {
+        "root": root,
+        "html_dir": os.path.join(root, "html"),
+        "docs_dir": os.path.join(root, "uploads"),
+        "embeddings": os.path.join(root, "embeddings"),
+        "routing": os.path.join(root, "page_routing.json"),
+        "snapshots": os.path.join(root, "snapshots"),
+        "version": os.path.join(root, "index_version"),
+        "index": os.path.join(root, "vector_store.index"),
+        "chunks": os.path.join(root, "chunks.bin"),
+        "manifest": os.path.join(root, "manifest.json")
+    }
+
+
+def _snapshot_files(directory: str) -> Dict[str, str]:
+    return {
+        "dir": directory,
+        "index": os.path.join(directory, "vector_store.index"),
+        "chunks": os.path.join(directory, "chunks.bin"),
+        "manifest": os.path.join(directory, "manifest.json")
+    }
+
+
+def snapshot_paths(project: str = None, version: str = None) -> Dict[str, str]:
+    """
+    Files of one published index snapshot. A version without a snapshot
+    directory (or None) maps to the pre-snapshot files in the project root.
+    """
+    paths = kb_paths(project)
+    directory = os.path.join(paths["snapshots"], version) if version else None
+    if directory is None or not os.path.isdir(directory):
+        return {"dir": paths["root"], "index": paths["index"], "chunks": paths["chunks"],
+                "manifest": paths["manifest"]}
+    return _snapshot_files(directory)
+
+
+def staging_paths(project: str = None, version: str = None) -> Dict[str, str]:
+    """Where a build writes its snapshot before publishing it (hidden from snapshot listings)."""
+    return _snapshot_files(os.path.join(kb_paths(project)["snapshots"], f".{version}.tmp"))
+
+
+def list_projects() -> List[str]:
+    """Every project with a directory on disk (the default project always)."""
+    projects = {DEFAULT_PROJECT}
+    if os.path.isdir(PROJECTS_DIR):
+        projects.update(name for name in os.listdir(PROJECTS_DIR)
+                        if PROJECT_ID.match(name) and os.path.isdir(os.path.join(PROJECTS_DIR, name)))
+    return sorted(projects)
@@ -1,58 +1,40 @@
 import os
 import json
 import re
-from typing import Dict, Any
+import time
+import asyncio
+from typing import Dict, Any, List
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from backend.vector_store import search_vector_db
+from backend.vector_store import indexed_sources, page_scope
+from backend.context import assemble_contexts
+from backend.chunker import count_tokens
+from backend.metrics import timed, PROMPT_CHARS, PROMPT_TOKENS, PARSE_FAILURES
+from backend import llm_client
 
-import google.generativeai as genai
+TEST_CASE_MODEL = llm_client.task_model("test_cases")
+TEST_CASE_MAX_TOKENS = 1200
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
-    raise RuntimeError("GEMINI_API_KEY not set in environment variables.")
-model = genai.GenerativeModel("gemini-2.0-flash")
+# Follow-up requests for the rest of a reply cut off at max_output_tokens
+MAX_CONTINUATIONS = int(os.getenv("MAX_CONTINUATIONS", "2"))
 
 
-def call_llm(prompt: str, max_tokens: int = 2000) -> str:
-    """
-    Calls Gemini 2.0 Flash with the given prompt.
-    Returns the raw text response.
-    """
-    response = model.generate_content(
-        prompt,
-        generation_config={
-            "temperature": 0.4,
-            "max_output_tokens": max_tokens,
-            "response_mime_type": "application/json"
-        }
-    )
-
-    try:
-        if hasattr(response, "candidates") and response.candidates:
-            candidate = response.candidates[0]
-
-            if hasattr(candidate, "content") and hasattr(candidate.content, "parts"):
-                parts = candidate.content.parts
-                collected = []
-
-                for part in parts:
-                    if hasattr(part, "text") and part.text:
-                        collected.append(part.text)
-
-                if collected:
-                    return "\n".join(collected)
-
-        
-        return ""
+def _test_case_config(max_tokens: int) -> dict:
+    return {
+        "temperature": 0.4,
+        "max_output_tokens": max_tokens,
+        "response_mime_type": "application/json"
+    }
 
-    except Exception as e:
-        return f""  # Safe fallback
 
+async def acall_llm(prompt: str, max_tokens: int = 2000, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Calls the test-case model (TEST_CASE_MODEL) with the given prompt.
+    Returns the full client result (text, error, latency, usage); never raises.
+    """
+    return await llm_client.agenerate(TEST_CASE_MODEL, prompt, _test_case_config(max_tokens), use_cache)
 
 
 def extract_first_json(text: str) -> Any:
@@ -104,6 +86,59 @@ def extract_first_json(text: str) -> Any:
     raise ValueError("No complete JSON found (unmatched braces)")
 
 
+class TestCaseStreamParser:
+    """
+    Incremental scanner for streamed LLM JSON. feed() takes the next piece of
+    text and returns every object of the test_cases array (or of a bare
+    top-level array) that closed in it, already parsed.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.item_start = None
+
+    def _in_items(self) -> bool:
+        return self.stack == ["{", "["] or self.stack == ["["]
+
+    def feed(self, delta: str) -> List[Any]:
+        self.text += delta
+        items = []
+
+        for i in range(self.pos, len(self.text)):
+            ch = self.text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+
+            if ch == '"':
+                self.in_string = True
+            elif ch in "{[":
+                if ch == "{" and self._in_items():
+                    self.item_start = i
+                self.stack.append(ch)
+            elif ch in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if ch == "}" and self.item_start is not None and self._in_items():
+                    try:
+                        items.append(json.loads(self.text[self.item_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self.item_start = None
+
+        self.pos = len(self.text)
+        return items
+
+
 PROMPT_TEMPLATE = """
 You are a Test Case Generator AI.  
 Your job is ONLY to generate structured test cases based on the given context.  
@@ -117,6 +152,7 @@ Your JSON must follow this structure exactly:
   "test_cases": [
     {{
       "id": "TC001",
+      "page": "file name of the HTML page the test runs on (from the chunk source)",
       "type": "positive or negative",
       "input": "input description",
       "steps": ["step 1", "step 2"],
@@ -142,52 +178,337 @@ IMPORTANT RULES:
 Generate all test cases now.
 """
 
-def generate_test_cases(user_query: str, k: int = 6) -> Dict[str, Any]:
+class UnknownPage(ValueError):
+    """A page restriction names no HTML page of the project's knowledge base."""
+
+
+def retrieval_sources(page: str = None, project: str = None):
     """
-    Full RAG pipeline:
-    1. Retrieve relevant chunks from FAISS
-    2. Send context + query to Gemini
-    3. Parse JSON output
+    Sources to retrieve from for one HTML page (by file name) plus all support docs; None for all.
+    Raises UnknownPage if a knowledge base is built but has no such page.
+    """
+    if not page:
+        return None
+    name = os.path.basename(page)
+    files = indexed_sources(project=project)
+    html = [path for path, entry in files.items() if entry["doc_type"] == "html"]
+    pages = [path for path in html if os.path.basename(path) in (name, name + ".html")]
+    if files and not pages:
+        known = ", ".join(sorted(os.path.basename(path) for path in html)) or "none"
+        raise UnknownPage(f"Unknown page '{page}' (indexed pages: {known})")
+    return page_scope(pages, project)
+
+
+def build_prompt(user_query: str, k: int = None, page: str = None, budget: int = None, project: str = None):
+    """
+    Retrieve relevant chunks from FAISS and build the test-case prompt.
+    k candidates are merged, deduplicated and MMR-ordered into a context of
+    at most `budget` tokens (see backend/context.py).
+    page restricts the HTML context to that page (support docs are always searched).
+    project selects the knowledge base (default: DEFAULT_PROJECT).
+    Returns (prompt, context_blocks, passages, context_stats). prompt is None if
+    there is no context to send: context_blocks is then None if the vector DB is
+    not ready, or [] if no retrieved passage matched or fit the budget.
     """
+    return build_prompts([user_query], k, page, budget, project)[0]
+
+
+def build_prompts(user_queries: List[str], k: int = None, page: str = None, budget: int = None,
+                  project: str = None):
+    """build_prompt() for many queries, retrieved with one batched embed + search."""
+    contexts = assemble_contexts(user_queries, budget=budget, candidates=k,
+                                 sources=retrieval_sources(page, project), project=project)
+
+    prompts = []
+    for user_query, (context_blocks, passages, stats) in zip(user_queries, contexts):
+        if not context_blocks:
+            prompts.append((None, context_blocks, [], stats))
+            continue
+        with timed("prompt_build"):
+            prompt = PROMPT_TEMPLATE.format(context="\n\n".join(context_blocks), user_request=user_query)
+            stats["prompt_tokens"] = count_tokens(prompt)
+        PROMPT_CHARS.inc(len(prompt), task="test_cases")
+        PROMPT_TOKENS.inc(stats["prompt_tokens"], task="test_cases")
+        prompts.append((prompt, context_blocks, passages, stats))
+    return prompts
+
+
+def not_ready_result() -> Dict[str, Any]:
+    return {
+        "error": "Vector DB not ready. Please upload files and build knowledge base.",
+        "raw_llm": None,
+        "parsed": None,
+        "used_context": [],
+        "sources": []
+    }
 
-    results = search_vector_db(user_query, top_k=k)
 
-    if not isinstance(results, list) or not results or not isinstance(results[0], tuple):
-        return {
-            "error": "Vector DB not ready. Please upload files and build knowledge base.",
-            "raw_llm": None,
-            "parsed": None,
-            "used_context": []
-        }
+def no_context_result(context_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """The knowledge base is built, but no passage matched or fit the context budget."""
+    if context_stats["candidates"]:
+        error = (f"No retrieved passage fits the {context_stats['budget_tokens']} token context budget; "
+                 "raise context_tokens.")
+    else:
+        error = "No passages in the knowledge base match this request."
+    return {**not_ready_result(), "error": error, "context": context_stats}
 
-    # Build context text
-    context_blocks = []
-    for i, (chunk_text, dist) in enumerate(results):
-        snippet = chunk_text.strip()
-        if len(snippet) > 800:
-            snippet = snippet[:800] + " ...[truncated]..."
-        context_blocks.append(f"[CHUNK {i+1} | distance={dist}]\n{snippet}")
 
-    context = "\n\n".join(context_blocks)
+def empty_context_result(context_blocks, context_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Result for a request build_prompt() found no context for."""
+    return not_ready_result() if context_blocks is None else no_context_result(context_stats)
 
-   
-    prompt = PROMPT_TEMPLATE.format(context=context, user_request=user_query)
 
-   
-    raw_response = call_llm(prompt, max_tokens=1200)
-
-   
+def finish_result(raw_response: str, llm_error: str, context_blocks: List[str], results) -> Dict[str, Any]:
+    """Parse the LLM output into the generate_test_cases result."""
     parsed = None
     error = None
-    try:
-        parsed = extract_first_json(raw_response)
-    except Exception as e:
-        error = f"JSON parsing failed: {e}"
+    if llm_error:
+        error = f"LLM call failed: {llm_error}"
+    else:
+        try:
+            with timed("json_parse"):
+                parsed = extract_first_json(raw_response)
+        except Exception as e:
+            error = f"JSON parsing failed: {e}"
+            PARSE_FAILURES.inc(task="test_cases")
 
     return {
         "raw_llm": raw_response,
         "parsed": parsed,
         "error": error,
-        "used_context": context_blocks
+        "used_context": context_blocks,
+        "sources": source_list(results)
+    }
+
+
+def source_list(results) -> List[Dict[str, Any]]:
+    """Provenance of the retrieved passages, without their text."""
+    return [
+        {**{k: chunk[k] for k in ("id", "source", "doc_type", "start", "end", "distance")},
+         "ids": chunk.get("ids", [chunk["id"]])}
+        for chunk in results
+    ]
+
+
+# ---------- truncated replies ----------
+
+CONTINUATION_TEMPLATE = """{prompt}
+
+------------------------
+Your previous reply was cut off by the output length limit. These test cases are complete:
+{done_ids}
+
+Continue from {next_id}: generate ONLY the remaining test cases, without repeating any of the above.
+Reply with a single complete JSON object {{"test_cases": [...]}}.
+"""
+
+
+def salvage_test_cases(text: str) -> List[Dict[str, Any]]:
+    """Every complete test case object in a (possibly truncated) reply."""
+    return TestCaseStreamParser().feed(text or "")
+
+
+def next_case_id(cases: List[Dict[str, Any]]) -> str:
+    """TC007 -> TC008, keeping the prefix and zero padding."""
+    last = str(cases[-1].get("id", len(cases))) if cases else "TC000"
+    m = re.match(r"^(.*?)(\d+)$", last)
+    if not m:
+        return f"the test case after {last}"
+    return f"{m.group(1)}{int(m.group(2)) + 1:0{len(m.group(2))}d}"
+
+
+def continuation_prompt(prompt: str, cases: List[Dict[str, Any]]) -> str:
+    return CONTINUATION_TEMPLATE.format(
+        prompt=prompt.rstrip(),
+        done_ids=", ".join(str(c.get("id")) for c in cases),
+        next_id=next_case_id(cases)
+    )
+
+
+async def acontinue_test_cases(prompt: str, cases: List[Dict[str, Any]], use_cache: bool = True):
+    """
+    Ask for the rest of a truncated test_cases array instead of regenerating it,
+    up to MAX_CONTINUATIONS follow-ups. New cases are appended to `cases`.
+    Yields ("test_case", case) for each new case as it closes, then
+    ("continued", {"requests", "complete"}).
+    """
+    seen = {c.get("id") for c in cases}
+    requests = []
+    complete = False
+
+    while not complete and len(requests) < MAX_CONTINUATIONS:
+        parser = TestCaseStreamParser()
+        added = 0
+        llm = None
+        config = _test_case_config(TEST_CASE_MAX_TOKENS)
+        async for item in llm_client.astream(TEST_CASE_MODEL, continuation_prompt(prompt, cases), config, use_cache):
+            if isinstance(item, dict):
+                llm = item
+                break
+            for case in parser.feed(item):
+                if case.get("id") in seen:
+                    continue
+                seen.add(case.get("id"))
+                cases.append(case)
+                added += 1
+                yield "test_case", case
+
+        requests.append({k: llm[k] for k in ("cached", "attempts", "latency", "usage", "error")})
+        if llm["error"]:
+            break
+        try:
+            extract_first_json(llm["text"])
+            complete = True
+        except ValueError:
+            # Truncated again: go on only while it still makes progress
+            if not added:
+                break
+
+    yield "continued", {"requests": requests, "complete": complete}
+
+
+async def arecover_truncated(result: Dict[str, Any], prompt: str, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    If the reply did not parse, keep its complete test cases and request the rest.
+    Sets result["parsed"] and result["continuation"] when anything was salvaged.
+    """
+    if result["parsed"] is not None or not result["raw_llm"]:
+        return result
+
+    cases = salvage_test_cases(result["raw_llm"])
+    if not cases:
+        return result
+
+    salvaged = len(cases)
+    async for event, data in acontinue_test_cases(prompt, cases, use_cache):
+        if event == "continued":
+            info = data
+
+    result["parsed"] = {"test_cases": cases}
+    result["error"] = None
+    result["continuation"] = {"salvaged": salvaged, "added": len(cases) - salvaged, **info}
+    return result
+
+
+async def agenerate_test_cases(user_query: str, k: int = None, use_cache: bool = True,
+                               page: str = None, budget: int = None, project: str = None) -> Dict[str, Any]:
+    """
+    Full RAG pipeline:
+    1. Retrieve relevant chunks from FAISS
+    2. Send context + query to the test-case model
+    3. Parse JSON output, continuing a truncated reply
+    Retrieval runs in a worker thread, the model call on the shared LLM client,
+    so no thread is held while waiting on the model.
+    Adds "llm" with latency, attempts and token usage.
+    """
+    built = await asyncio.to_thread(build_prompt, user_query, k, page, budget, project)
+    return await acomplete_test_cases(*built, use_cache=use_cache)
+
+
+async def acomplete_test_cases(prompt: str, context_blocks, passages, context_stats,
+                               use_cache: bool = True) -> Dict[str, Any]:
+    """LLM half of agenerate_test_cases(), for a prompt from build_prompt()."""
+    if prompt is None:
+        return empty_context_result(context_blocks, context_stats)
+
+    llm = await acall_llm(prompt, max_tokens=TEST_CASE_MAX_TOKENS, use_cache=use_cache)
+    result = finish_result(llm["text"], llm["error"], context_blocks, passages)
+    result["llm"] = {k: llm[k] for k in ("model", "cached", "attempts", "latency", "usage")}
+    result["context"] = context_stats
+    return await arecover_truncated(result, prompt, use_cache)
+
+
+# Test-case requests of one batch sent concurrently
+TEST_CASE_BATCH_WORKERS = int(os.getenv("TEST_CASE_BATCH_WORKERS", "4"))
+
+
+async def agenerate_test_cases_batch(user_queries: List[str], k: int = None, use_cache: bool = True,
+                                     page: str = None, budget: int = None,
+                                     max_workers: int = None, project: str = None) -> Dict[str, Any]:
+    """
+    Test cases for many queries: one embedding batch and one index search for
+    all of them, then the LLM calls concurrently (max_workers at a time).
+    Returns {"results": [one per query, in order], "timing": {...}}.
+    """
+    started = time.perf_counter()
+    built = await asyncio.to_thread(build_prompts, user_queries, k, page, budget, project)
+    retrieval_seconds = time.perf_counter() - started
+
+    limit = asyncio.Semaphore(max_workers or TEST_CASE_BATCH_WORKERS)
+
+    async def one(query: str, prompt_parts):
+        async with limit:
+            result = await acomplete_test_cases(*prompt_parts, use_cache=use_cache)
+        return {"query": query, **result}
+
+    llm_started = time.perf_counter()
+    results = await asyncio.gather(*(one(q, parts) for q, parts in zip(user_queries, built)))
+    llm_seconds = time.perf_counter() - llm_started
+
+    calls = [r["llm"] for r in results if r.get("llm")]
+    return {
+        "results": results,
+        "timing": {
+            "queries": len(user_queries),
+            "retrieval_seconds": round(retrieval_seconds, 4),
+            "llm_seconds": round(llm_seconds, 4),
+            "total_seconds": round(time.perf_counter() - started, 4),
+            "llm_latency_sum": round(sum(c["latency"] for c in calls), 4),
+            "cache_hits": sum(1 for c in calls if c["cached"]),
+            "failed": sum(1 for r in results if r["parsed"] is None),
+            "prompt_tokens": sum(c["usage"]["prompt_tokens"] for c in calls),
+            "output_tokens": sum(c["usage"]["output_tokens"] for c in calls)
+        }
     }
 
+
+async def astream_test_cases(user_query: str, k: int = None, use_cache: bool = True, page: str = None,
+                             budget: int = None, project: str = None):
+    """
+    Streaming agenerate_test_cases(). Yields (event, data) pairs:
+    ("context", {"used_context", "sources"}) once retrieval is done,
+    ("test_case", case) as soon as each test case object closes in the
+    model output, and finally ("done", result) as from agenerate_test_cases().
+    """
+    started = time.perf_counter()
+    prompt, context_blocks, results, context_stats = await asyncio.to_thread(
+        build_prompt, user_query, k, page, budget, project
+    )
+    if prompt is None:
+        yield "done", empty_context_result(context_blocks, context_stats)
+        return
+
+    yield "context", {"used_context": context_blocks, "sources": source_list(results), "context": context_stats}
+
+    parser = TestCaseStreamParser()
+    cases = []
+    first_case = None
+    llm = None
+    config = _test_case_config(TEST_CASE_MAX_TOKENS)
+    async for item in llm_client.astream(TEST_CASE_MODEL, prompt, config, use_cache):
+        if isinstance(item, dict):
+            llm = item
+            break
+        for case in parser.feed(item):
+            if first_case is None:
+                first_case = round(time.perf_counter() - started, 4)
+            cases.append(case)
+            yield "test_case", case
+
+    result = finish_result(llm["text"], llm["error"], context_blocks, results)
+    result["llm"] = {k: llm[k] for k in ("model", "cached", "attempts", "latency", "first_token_latency", "usage")}
+    result["llm"]["time_to_first_case"] = first_case
+    result["context"] = context_stats
+
+    # Truncated reply: the cases so far are already out, stream the rest as it is continued
+    if result["parsed"] is None and cases:
+        salvaged = len(cases)
+        async for event, data in acontinue_test_cases(prompt, cases, use_cache):
+            if event == "continued":
+                result["continuation"] = {"salvaged": salvaged, "added": len(cases) - salvaged, **data}
+            else:
+                yield event, data
+        result["parsed"] = {"test_cases": cases}
+        result["error"] = None
+
+    yield "done", result
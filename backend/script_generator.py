@@ -1,30 +1,80 @@
 import os
 import json
 import re
-from backend.rag_agent import call_llm
-import google.generativeai as genai
+import io
+import asyncio
+import zipfile
+from backend import llm_client
+from backend.metrics import timed, PROMPT_CHARS, PROMPT_TOKENS, PARSE_FAILURES
+from backend.chunker import count_tokens
+from backend.dom_index import (
+    load_locator_index, relevant_elements, format_locators, list_pages, load_page_routing, route_pages,
+    MAX_PROMPT_ELEMENTS
+)
+from backend.projects import kb_paths
 
-HTML_DIR = "data/html/"
+def load_full_html(html_path: str = None, project: str = None):
+    """Load an uploaded HTML file (the project's first page if none is given)."""
+    if html_path is None:
+        pages = list_pages(kb_paths(project)["html_dir"])
+        if not pages:
+            return ""
+        html_path = pages[0]["path"]
 
-def load_full_html():
-    """Load the uploaded HTML file."""
-    if not os.path.exists(HTML_DIR):
+    try:
+        with open(html_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except Exception as e:
+        print(f"Error loading HTML: {e}")
         return ""
 
-    html_files = [f for f in os.listdir(HTML_DIR) if f.endswith(".html")]
-    
-    if not html_files:
-        return ""
 
-    html_path = os.path.join(HTML_DIR, html_files[0])
+def load_pages(project: str = None):
+    """
+    Routing index of a project's pages (see dom_index.load_page_routing): titles,
+    element counts and a word -> pages map, without loading any locator index.
+    """
+    paths = kb_paths(project)
+    return load_page_routing(paths["html_dir"], paths["routing"])
+
 
+def page_locators(page: dict):
+    """Locator index of one routed page (cached by content hash); None if it cannot be built."""
     try:
-        with open(html_path, "r", encoding="utf-8") as f:
-            return f.read()
+        return load_locator_index(page["path"], page["hash"])
     except Exception as e:
-        print(f"Error loading HTML: {e}")
+        print(f"Error indexing HTML {page['path']}: {e}")
+        return None
+
+
+def page_context(test_case: dict, pages: dict) -> str:
+    """
+    Elements of the page(s) the test case is routed to; only those pages'
+    locator indexes are loaded. Pages without an element index fall back
+    to their truncated body.
+    """
+    with timed("page_context"):
+        return _page_context(test_case, pages)
+
+
+def _page_context(test_case: dict, pages: dict) -> str:
+    routed = route_pages(test_case, pages)
+    if not routed:
         return ""
 
+    per_page = max(1, MAX_PROMPT_ELEMENTS // len(routed))
+    blocks = []
+    for page in routed:
+        locators = page_locators(page)
+        if locators and locators.get("elements"):
+            body = format_locators(relevant_elements(locators, test_case, per_page))
+        else:
+            body = prepare_html_snippet(load_full_html(page["path"]))
+        title = f" ({page['title']})" if page["title"] else ""
+        blocks.append(f"# Page: {page['name']}{title}\n{body}")
+
+    return "\n\n".join(blocks)
+
 
 SELENIUM_PROMPT = """
 CRITICAL INSTRUCTION: You are now in CODE GENERATION MODE. 
@@ -69,73 +119,127 @@ Expected Result:
 - Add try-except-finally blocks
 - Add assertions for expected outcomes
 - Close browser in finally block
+- Locate elements only with the css/xpath selectors listed above; do not invent ids
 
 BEGIN YOUR PYTHON CODE NOW (First line should be an import):
 """
 
 
-def generate_selenium_script(test_case: dict):
-    """
-    Generate Selenium Python script from test case.
-    Args: test_case: Dictionary with keys: id, type, input, steps, expected_output
-    Returns: tuple: (script_code: str, errors: list)
-    """
-    
-    html = load_full_html()
-    
+SELENIUM_MODEL = llm_client.task_model("selenium")
+
+SELENIUM_CONFIG = {
+    "temperature": 0.7,  
+    "max_output_tokens": 2000,
+    "top_p": 0.95,
+    "top_k": 40
+}
+
+
+def prepare_html_snippet(html: str) -> str:
+    """Body of the page, truncated to fit the prompt."""
     if len(html) > 1500:
         body_match = re.search(r'<body[^>]*>(.*?)</body>', html, re.DOTALL | re.IGNORECASE)
         if body_match:
             html = body_match.group(1)
         if len(html) > 1500:
             html = html[:1500] + "\n... [HTML truncated]"
-    
+    return html
+
+
+def build_selenium_prompt(test_case: dict, html_snippet: str) -> str:
     # Format test steps clearly
     steps = test_case.get("steps", [])
     steps_formatted = "\n".join([f"  {i+1}. {step}" for i, step in enumerate(steps)])
     
-    # Build prompt
-    prompt = SELENIUM_PROMPT.format(
+    return SELENIUM_PROMPT.format(
         test_id=test_case.get("id", "UNKNOWN"),
         test_type=test_case.get("type", "UNKNOWN"),
         test_input=test_case.get("input", "N/A"),
         steps_formatted=steps_formatted if steps_formatted else "  (No steps provided)",
         expected_output=test_case.get("expected_output", "N/A"),
-        html_snippet=html if html else "(No HTML available)"
+        html_snippet=html_snippet if html_snippet else "(No HTML available)"
     )
-    
-    
-    model = genai.GenerativeModel("gemini-2.0-flash")
-    
-    try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                "temperature": 0.7,  
-                "max_output_tokens": 2000,
-                "top_p": 0.95,
-                "top_k": 40
-            }
-        )
-        
-        # Extract text from response
-        if hasattr(response, "candidates") and response.candidates:
-            candidate = response.candidates[0]
-            if hasattr(candidate, "content") and hasattr(candidate.content, "parts"):
-                raw_response = "\n".join([
-                    part.text for part in candidate.content.parts 
-                    if hasattr(part, "text") and part.text
-                ])
-            else:
-                raw_response = ""
-        else:
-            raw_response = ""
-            
-    except Exception as e:
+
+
+async def agenerate_selenium_script(test_case: dict, use_cache: bool = True, html_snippet: str = None,
+                                    pages: list = None, project: str = None):
+    """
+    Generate Selenium Python script from test case.
+    Args: test_case: Dictionary with keys: id, type, input, steps, expected_output
+          use_cache: reuse a cached response for an identical prompt
+          html_snippet: fixed page context to send instead of the matched pages
+          pages: already loaded page routing index to reuse (e.g. once for a whole batch)
+          project: knowledge base whose pages are used (default: DEFAULT_PROJECT)
+    Returns: tuple: (script_code: str, errors: list)
+    """
+    if html_snippet is None:
+        if pages is None:
+            pages = await asyncio.to_thread(load_pages, project)
+        html_snippet = await asyncio.to_thread(page_context, test_case, pages)
+    prompt = build_selenium_prompt(test_case, html_snippet)
+    PROMPT_CHARS.inc(len(prompt), task="selenium")
+    PROMPT_TOKENS.inc(count_tokens(prompt), task="selenium")
+    result = await llm_client.agenerate(SELENIUM_MODEL, prompt, SELENIUM_CONFIG, use_cache)
+    return postprocess_script(result)
+
+
+# Scripts of one batch request generated concurrently
+SCRIPT_BATCH_WORKERS = int(os.getenv("SCRIPT_BATCH_WORKERS", "4"))
+
+
+async def agenerate_selenium_scripts(test_cases: list, use_cache: bool = True, max_workers: int = None,
+                                     project: str = None):
+    """
+    Generate scripts for a whole list of test cases concurrently.
+    The page routing index is loaded once; at most max_workers cases
+    are in progress at a time. Returns one result per test case, in input order.
+    """
+    pages = await asyncio.to_thread(load_pages, project)
+    limit = asyncio.Semaphore(max_workers or SCRIPT_BATCH_WORKERS)
+
+    async def one(position: int, test_case: dict):
+        async with limit:
+            script, errors = await agenerate_selenium_script(test_case, use_cache, pages=pages)
+        return {
+            "test_case_id": test_case.get("id") or f"case_{position + 1}",
+            "selenium_script": script,
+            "errors": errors,
+            "success": len(errors) == 0
+        }
+
+    return await asyncio.gather(*(one(i, tc) for i, tc in enumerate(test_cases)))
+
+
+def scripts_zip(results: list) -> bytes:
+    """Zip of <test id>_selenium_test.py files for a batch result."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        used = set()
+        for r in results:
+            name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(r["test_case_id"]))
+            while name in used:
+                name += "_"
+            used.add(name)
+            zf.writestr(f"{name}_selenium_test.py", r["selenium_script"])
+    return buffer.getvalue()
+
+
+def postprocess_script(result: dict):
+    """Turn an LLM client result into (script_code, errors)."""
+    with timed("script_postprocess"):
+        code, errors = _postprocess_script(result)
+    if errors:
+        PARSE_FAILURES.inc(task="selenium")
+    return code, errors
+
+
+def _postprocess_script(result: dict):
+    if result["error"]:
         return (
-            f"# ERROR: Failed to call LLM\n# {str(e)}",
-            [f"LLM call failed: {str(e)}"]
+            f"# ERROR: Failed to call LLM\n# {result['error']}",
+            [f"LLM call failed: {result['error']}"]
         )
+    raw_response = result["text"]
     
     if not raw_response or not raw_response.strip():
         return (
@@ -199,26 +303,3 @@ def generate_selenium_script(test_case: dict):
         )
     
     return code, errors
-
-
-# Test function
-# if __name__ == "__main__":
-#     sample = {
-#         "id": "TC001",
-#         "type": "positive",
-#         "input": "Valid form submission",
-#         "steps": [
-#             "Open checkout page",
-#             "Fill name field",
-#             "Fill email field",
-#             "Click submit"
-#         ],
-#         "expected_output": "Form submits successfully"
-#     }
-    
-#     script, errs = generate_selenium_script(sample)
-#     print("=" * 70)
-#     print(script)
-#     print("=" * 70)
-#     if errs:
-#         print("ERRORS:", errs)
\ No newline at end of file
@@ -0,0 +1,168 @@
+import os
+import asyncio
+import json
+import hashlib
+from typing import Dict, Any, List
+
+from backend.manifest import cached_file_sha256, remember_file_sha256
+
+# Uploads are copied to disk in blocks of this size, never held whole in memory
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("MAX_UPLOAD_FILE_BYTES", str(50 * 1024 * 1024)))
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", str(200 * 1024 * 1024)))
+# Room for multipart boundaries and part headers on top of the file bytes
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """An uploaded file or the whole request is over its size limit."""
+
+
+class UploadBudget:
+    """Bytes left for the files of one upload request."""
+
+    def __init__(self, max_bytes: int = None):
+        self.remaining = MAX_UPLOAD_REQUEST_BYTES if max_bytes is None else max_bytes
+
+    def take(self, n: int):
+        self.remaining -= n
+        if self.remaining < 0:
+            raise UploadTooLarge(f"Upload exceeds the {MAX_UPLOAD_REQUEST_BYTES} byte request limit")
+
+
+class RequestSizeLimit:
+    """
+    ASGI middleware that rejects request bodies over max_bytes on `paths` with
+    413 before the multipart form is parsed and spooled: up front from
+    Content-Length, or while the body is read if it is sent chunked.
+    """
+
+    def __init__(self, app, paths=("/upload_files",), max_bytes: int = None):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = (MAX_UPLOAD_REQUEST_BYTES + MULTIPART_OVERHEAD_BYTES) if max_bytes is None else max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        try:
+            content_length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            content_length = 0
+        if content_length > self.max_bytes:
+            return await self.reject(send)
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Answer now and end the body; the app then fails to parse
+                    # it, and its own error response is dropped below
+                    rejected = True
+                    await self.reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    async def reject(self, send):
+        body = json.dumps({"detail": f"Upload exceeds the {MAX_UPLOAD_REQUEST_BYTES} byte request limit"}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+
+def safe_filename(filename: str) -> str:
+    """Only the final path component, so an upload cannot escape its directory."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if not name or name.startswith("."):
+        raise ValueError(f"Invalid file name '{filename}'")
+    return name
+
+
+async def save_upload(upload, dest_dir: str, budget: UploadBudget = None,
+                      max_file_bytes: int = None) -> Dict[str, Any]:
+    """
+    Stream an UploadFile into dest_dir in UPLOAD_CHUNK_SIZE blocks, hashing
+    it on the way. The file is staged under a temporary name; publish_uploads
+    renames a request's files into place once all of them are saved, so a
+    build never sees half an upload and a rejected request leaves nothing behind.
+    A file identical to the one stored under its name is marked duplicate and not staged.
+    Returns {"path", "tmp_path", "bytes", "hash", "duplicate"}; raises UploadTooLarge.
+    """
+    max_file_bytes = MAX_UPLOAD_FILE_BYTES if max_file_bytes is None else max_file_bytes
+
+    os.makedirs(dest_dir, exist_ok=True)
+    path = os.path.join(dest_dir, safe_filename(upload.filename))
+    tmp_path = os.path.join(dest_dir, f".{os.path.basename(path)}.{os.getpid()}.{id(upload)}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                block = await upload.read(UPLOAD_CHUNK_SIZE)
+                if not block:
+                    break
+                size += len(block)
+                if size > max_file_bytes:
+                    raise UploadTooLarge(
+                        f"{upload.filename} exceeds the {max_file_bytes} byte per-file limit"
+                    )
+                if budget is not None:
+                    budget.take(len(block))
+                digest.update(block)
+                await asyncio.to_thread(f.write, block)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    content_hash = digest.hexdigest()
+    # Compare with the stored file itself, not the manifest: it may hold content
+    # that is newer than the served index (e.g. while a build is pending).
+    # Its hash is only computed again if it changed since it was last hashed or published.
+    duplicate = (os.path.exists(path) and os.path.getsize(path) == size
+                 and await asyncio.to_thread(cached_file_sha256, path) == content_hash)
+    if duplicate:
+        os.remove(tmp_path)
+        tmp_path = None
+
+    return {"path": path, "tmp_path": tmp_path, "bytes": size, "hash": content_hash, "duplicate": duplicate}
+
+
+def publish_uploads(saved: List[Dict[str, Any]]):
+    """Rename the staged files of a request into place."""
+    for f in saved:
+        if f["tmp_path"]:
+            os.replace(f["tmp_path"], f["path"])
+            f["tmp_path"] = None
+            remember_file_sha256(f["path"], f["hash"])
+
+
+def discard_uploads(saved: List[Dict[str, Any]]):
+    """Remove the staged files of a rejected request; stored files are untouched."""
+    for f in saved:
+        if f["tmp_path"]:
+            try:
+                os.remove(f["tmp_path"])
+            except FileNotFoundError:
+                pass
+            f["tmp_path"] = None
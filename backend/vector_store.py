@@ -1,91 +1,726 @@
 import os
+import time
+import shutil
+import hashlib
+import threading
 import faiss
-from sentence_transformers import SentenceTransformer
-from typing import List, Tuple
+import numpy as np
+from typing import List, Tuple, Dict, Any, Iterable, Iterator, Optional
 
-embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+from backend.processor import list_source_files, iter_documents, file_report
+from backend.cache import LRUCache
+from backend.metrics import timed, CHUNKS_EMBEDDED, QUERIES_EMBEDDED
+from backend.chunker import chunk_document, document_kind, chunker_signature
+from backend.chunk_store import ChunkStoreWriter, open_chunk_store
+from backend.dom_index import load_locator_index, load_page_routing
+from backend.index_types import (
+    resolve_index_type, build_index, index_kind, supports_remove, supports_selector, search_params
+)
+from backend.manifest import file_sha256, load_manifest, save_manifest, empty_manifest, diff_sources
+from backend.projects import kb_paths, project_name, snapshot_paths, staging_paths
 
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
 
-FAISS_INDEX_PATH = "data/vector_store.index"
+# Loaded on first use (or by warm_up()), so importing this module stays cheap
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
 
 
-CHUNKS_FILE = "data/chunks.txt"
+def get_embedding_model():
+    """Load the SentenceTransformer once, on first use."""
+    global _embedding_model
 
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                from sentence_transformers import SentenceTransformer
+                _embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
 
-def chunk_text(text: str, chunk_size=500, overlap=50) -> List[str]:
+    return _embedding_model
+
+
+# Index, chunk store, embedding rows and version stamp live per project (see backend/projects.py).
+# Every build is written to its own snapshot directory and published by swapping the
+# version pointer; the newest SNAPSHOTS_KEEP snapshots are kept for rollback.
+SNAPSHOTS_KEEP = max(1, int(os.getenv("SNAPSHOTS_KEEP", "3")))
+
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+
+
+# Resident project indexes, least recently used evicted past either limit.
+# Index files are read fully into memory, so their size is the weight (0 = no byte limit).
+MAX_LOADED_INDEXES = int(os.getenv("MAX_LOADED_INDEXES", "8"))
+MAX_LOADED_INDEX_BYTES = int(os.getenv("MAX_LOADED_INDEX_BYTES", "0"))
+
+# Repeated queries skip encoding and search. Result keys carry the project and
+# index version, so a rebuild makes old entries unreachable (they age out of the LRU).
+# Query embeddings do not depend on the project and are shared by all of them.
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+query_embedding_cache = LRUCache(QUERY_CACHE_SIZE)
+search_result_cache = LRUCache(QUERY_CACHE_SIZE)
+# Manifest of each resident index version, for source filters
+manifest_cache = LRUCache(MAX_LOADED_INDEXES + 1)
+
+# Memory-mapped stored embedding rows, per rows key
+rows_cache = LRUCache(64)
+
+# Source-restricted searches are exact over the stored rows of those sources.
+# Only if rows are missing is the index searched and filtered instead; without
+# id selectors (HNSW) that fetches this many times top_k and filters
+FILTER_OVERFETCH = int(os.getenv("FILTER_OVERFETCH", "10"))
+
+
+def embed_batches(spans: Iterable[Tuple[int, int, str]], batch_size=None) -> Iterator[Tuple[list, np.ndarray]]:
     """
-    Very simple chunking function.
-    Splits text into overlapping blocks.
+    Streams (spans, embeddings) in batches of at most batch_size chunks,
+    so only one batch of vectors is in memory at a time.
     """
-    chunks = []
-    start = 0
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    batch = []
+
+    for span in spans:
+        batch.append(span)
+        if len(batch) == batch_size:
+            yield batch, encode_spans(batch)
+            batch = []
 
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-        start += chunk_size - overlap
+    if batch:
+        yield batch, encode_spans(batch)
 
-    return chunks
 
+def encode_spans(spans) -> np.ndarray:
+    with timed("chunk_embedding"):
+        embeddings = np.asarray(get_embedding_model().encode([chunk for _, _, chunk in spans]), dtype="float32")
+    CHUNKS_EMBEDDED.inc(len(spans))
+    return embeddings
 
-def build_faiss_index(full_text: str):
+
+def new_index(dimension: int):
+    """Empty ID-mapped flat index that builds stream into before any ANN conversion."""
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+
+
+def rebuild_from_stored_rows(manifest, index_type: str, embeddings_dir: str):
     """
-    Build FAISS vector DB from processed text.
+    Rebuild the index as index_type from the per-file embedding rows on disk,
+    without re-embedding anything. Returns None if some rows are missing.
     """
-    
-    chunks = chunk_text(full_text)
-    embeddings = embedding_model.encode(chunks)
+    entries = list(manifest["files"].values())
+    total = sum(len(entry["chunk_ids"]) for entry in entries)
+
+    def blocks():
+        for entry in entries:
+            rows = load_embeddings(entry["rows"], len(entry["chunk_ids"]), embeddings_dir)
+            if rows is None:
+                raise FileNotFoundError(f"Embedding rows missing for {entry['rows']}")
+            yield np.asarray(entry["chunk_ids"], dtype="int64"), rows
+
+    try:
+        return build_index(index_type, blocks, total)
+    except FileNotFoundError as e:
+        print(f"Error rebuilding index: {e}")
+        return None
+
+
+def update_faiss_index(html_dir=None, docs_dir=None, workers=None, index_type=None,
+                       progress=None, project: str = None):
+    """
+    Incremental rebuild of a project's knowledge base, keyed on content hashes.
+    html_dir / docs_dir default to the project's upload directories.
+    Only new or changed source files are extracted and embedded; chunks of
+    changed or deleted files are removed from the index by id.
+    The index is rebuilt from stored embedding rows (never re-embedded) when
+    the wanted index type changes, an IVF index has doubled since training,
+    or an HNSW index has to drop vectors.
+    progress(stage, done, total) is called as the build moves through
+    scanning, processing (per file) and indexing.
+    """
+    progress = progress or (lambda stage, done=0, total=0: None)
+    paths = kb_paths(project)
+    html_dir = html_dir or paths["html_dir"]
+    docs_dir = docs_dir or paths["docs_dir"]
+    embeddings_dir = paths["embeddings"]
+    current_version = read_index_version(project)
+    manifest = load_manifest(snapshot_paths(project, current_version)["manifest"])
+    index, chunks = load_faiss_index(project, current_version)
+
+    # Without an index or a manifest nothing can be reused
+    if index is None or chunks is None or not manifest["files"]:
+        index, chunks = None, None
+        manifest = empty_manifest()
+
+    sources = list_source_files(html_dir, docs_dir)
+    doc_types = dict(sources)
+    hashes = {}
+    for path, _ in sources:
+        progress("scanning", len(hashes), len(sources))
+        hashes[path] = file_sha256(path)
+    signature = embedding_signature()
+    diff = diff_sources(manifest, hashes, signature)
+    has_changes = bool(diff["added"] or diff["changed"] or diff["removed"])
+
+    # Everything is written to a new snapshot; readers keep using the current one until it is published
+    version = new_index_version()
+    staging = staging_paths(project, version)
+
+    # The chunk store is rewritten: unchanged files' records are copied over as raw bytes
+    writer = ChunkStoreWriter(staging["chunks"]) if has_changes else None
+    try:
+        if writer is not None and chunks is not None:
+            for path in diff["unchanged"]:
+                writer.copy_from(chunks, manifest["files"][path]["chunk_ids"])
+
+        # Drop chunks of changed and deleted files (their embedding rows go when no kept snapshot uses them)
+        needs_rebuild = False
+        for path in diff["changed"] + diff["removed"]:
+            entry = manifest["files"].pop(path)
+            stale_ids = np.asarray(entry["chunk_ids"], dtype="int64")
+            if index is not None and len(stale_ids):
+                if supports_remove(index_kind(index)):
+                    index.remove_ids(stale_ids)
+                else:
+                    needs_rebuild = True
+
+        # Stream new and changed files through extraction → chunking → embedding
+        pending = [(path, doc_types[path]) for path in diff["added"] + diff["changed"]]
+
+        processed_length = 0
+        embedded_chunks = 0
+        extraction = []
+        progress("processing", 0, len(pending))
+        for result in iter_documents(pending, workers):
+            extraction.append(file_report(result))
+            progress("processing", len(extraction), len(pending))
+            if result["error"]:
+                # Left out of the manifest, so the next update retries it
+                continue
+
+            path = result["path"]
+            rows_key = f"{hashes[path]}-{signature}"
+            if doc_types[path] == "html":
+                # Parsed once here, so script generation only reads the cached index
+                try:
+                    load_locator_index(path, hashes[path])
+                except Exception as e:
+                    print(f"Error indexing HTML elements of {path}: {e}")
+            processed_length += len(result["text"])
+
+            spans = list(chunk_document(result["text"], document_kind(path, doc_types[path])))
+            stored = load_embeddings(rows_key, len(spans), embeddings_dir)
+            if stored is not None:
+                batches = [(spans, stored)]
+                rows_file = None
+            else:
+                batches = embed_batches(spans)
+                os.makedirs(embeddings_dir, exist_ok=True)
+                rows_file = open(embeddings_path(rows_key, embeddings_dir) + ".tmp", "wb")
+
+            file_ids = []
+            for batch, embeddings in batches:
+                start = manifest["next_id"]
+                ids = np.arange(start, start + len(batch), dtype="int64")
+                manifest["next_id"] = start + len(batch)
 
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
+                if index is None:
+                    index = new_index(embeddings.shape[1])
+                index.add_with_ids(embeddings, ids)
 
-    faiss.write_index(index, FAISS_INDEX_PATH)
+                for chunk_id, (chunk_start, chunk_end, chunk) in zip(ids, batch):
+                    writer.add(chunk_id, chunk, source=path, doc_type=doc_types[path],
+                               start=chunk_start, end=chunk_end)
+                file_ids.extend(int(i) for i in ids)
+                if rows_file is not None:
+                    rows_file.write(embeddings.tobytes())
 
+            if rows_file is not None:
+                rows_file.close()
+                os.replace(rows_file.name, embeddings_path(rows_key, embeddings_dir))
+                embedded_chunks += len(file_ids)
 
-    os.makedirs("data", exist_ok=True)
-    with open(CHUNKS_FILE, "w", encoding="utf-8") as f:
-        for c in chunks:
-            f.write(c + "\n-----CHUNK_SEPARATOR-----\n")
+            if not file_ids:
+                continue
+
+            manifest["files"][path] = {
+                "hash": hashes[path],
+                "doc_type": doc_types[path],
+                "chunk_ids": file_ids,
+                "signature": signature,
+                "rows": rows_key
+            }
+
+        if writer is not None:
+            num_chunks = len(writer)
+        else:
+            num_chunks = len(chunks) if chunks is not None else 0
+
+        # Switch index type / retrain from the stored rows when needed
+        progress("indexing", 0, num_chunks)
+        resolved_type = resolve_index_type(num_chunks, index_type)
+        rebuilt = None
+        if index is not None:
+            current_type = index_kind(index)
+            outgrown = (
+                current_type in ("ivf_flat", "ivf_pq")
+                and num_chunks > 2 * manifest.get("trained_on", 0)
+            )
+            if needs_rebuild or outgrown or current_type != resolved_type:
+                rebuilt = rebuild_from_stored_rows(manifest, resolved_type, embeddings_dir)
+                if rebuilt is not None:
+                    index = rebuilt
+                    manifest["trained_on"] = num_chunks
+            manifest["index_type"] = index_kind(index)
+
+        if has_changes or rebuilt is not None:
+            os.makedirs(staging["dir"], exist_ok=True)
+            if writer is not None:
+                writer.close()
+            else:
+                # Only the index changed: the new snapshot shares the chunk store
+                link_or_copy(snapshot_paths(project, current_version)["chunks"], staging["chunks"])
+            if index is not None:
+                faiss.write_index(index, staging["index"])
+            save_manifest(manifest, staging["manifest"])
+            publish_snapshot(project, version)
+        else:
+            version = current_version
+    except BaseException:
+        # A failed build leaves no half-written snapshot behind
+        if writer is not None:
+            writer.abort()
+        shutil.rmtree(staging["dir"], ignore_errors=True)
+        raise
+
+    # Selenium requests route test cases with this instead of loading every page's locator index
+    try:
+        load_page_routing(paths["html_dir"], paths["routing"], refresh=True)
+    except OSError as e:
+        print(f"Error writing page routing index: {e}")
 
     return {
-        "message": "FAISS index built successfully",
-        "num_chunks": len(chunks)
+        "message": "FAISS index updated successfully",
+        "project": project_name(project),
+        "version": version,
+        "num_chunks": num_chunks,
+        "index_type": manifest.get("index_type"),
+        "processed_length": processed_length,
+        "embedded_chunks": embedded_chunks,
+        "added": diff["added"],
+        "changed": diff["changed"],
+        "removed": diff["removed"],
+        "unchanged": diff["unchanged"],
+        "extraction": extraction
     }
 
 
-def load_faiss_index():
-    """Load FAISS index + chunks when needed."""
-    if not os.path.exists(FAISS_INDEX_PATH):
-        return None, []
+def embedding_signature() -> str:
+    """Embedding model + chunker settings; stored rows are only reused when it matches."""
+    raw = f"{EMBEDDING_MODEL_NAME}|{chunker_signature()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def embeddings_path(rows_key: str, embeddings_dir: str) -> str:
+    """Raw float32 embedding rows, appended batch by batch during a build."""
+    return os.path.join(embeddings_dir, f"{rows_key}.f32")
+
 
-    index = faiss.read_index(FAISS_INDEX_PATH)
+def load_embeddings(rows_key: str, num_chunks: int, embeddings_dir: str):
+    """Reuse stored embedding rows for identical content, if present."""
+    path = embeddings_path(rows_key, embeddings_dir)
+    if not os.path.exists(path) or not num_chunks:
+        return None
+    embeddings = np.fromfile(path, dtype="float32")
+    if embeddings.size % num_chunks:
+        return None
+    return embeddings.reshape(num_chunks, -1)
 
-    
-    with open(CHUNKS_FILE, "r", encoding="utf-8") as f:
-        raw = f.read()
-        chunks = raw.split("-----CHUNK_SEPARATOR-----\n")
-        chunks = [c.strip() for c in chunks if c.strip()]
+
+def load_faiss_index(project: str = None, version: str = None):
+    """Load the FAISS index + memory-mapped chunk store of one snapshot of a project."""
+    paths = snapshot_paths(project, version)
+    if not os.path.exists(paths["index"]) or not os.path.exists(paths["chunks"]):
+        return None, None
+
+    index = faiss.read_index(paths["index"])
+    chunks = open_chunk_store(paths["chunks"])
 
     return index, chunks
 
 
-def search_vector_db(query: str, top_k=5) -> List[Tuple[str, float]]:
-    """Search FAISS db and return nearest chunks."""
+# Resident (version, index, chunks, bytes) per project, each swapped as one tuple
+# so readers never see an index paired with another build's chunks.
+resident_indexes = LRUCache(MAX_LOADED_INDEXES, max_weight=MAX_LOADED_INDEX_BYTES, weigh=lambda r: r[3])
+_resident_locks = {}
+_resident_lock = threading.Lock()
+# Pointer swaps and pruning of a project's snapshots happen one at a time
+_publish_lock = threading.Lock()
+
+
+def new_index_version() -> str:
+    return str(time.time_ns())
+
+
+def publish_index_version(version: str, project: str = None) -> str:
+    """Point the project at a snapshot (atomic rename); resident copies reload on their next query."""
+    path = kb_paths(project)["version"]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
+
 
-    index, chunks = load_faiss_index()
+def link_or_copy(src: str, dst: str):
+    """Share an unchanged (immutable) file between snapshots."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def publish_snapshot(project: str, version: str):
+    """
+    Move a fully written staging directory into place as snapshot `version`,
+    swap the version pointer to it and prune old snapshots.
+    """
+    staging = staging_paths(project, version)["dir"]
+    final = os.path.join(kb_paths(project)["snapshots"], version)
+    with _publish_lock:
+        os.rename(staging, final)
+        publish_index_version(version, project)
+        prune_snapshots(project)
+
+
+def list_snapshots(project: str = None) -> List[str]:
+    """Published snapshot versions of a project, oldest first."""
+    directory = kb_paths(project)["snapshots"]
+    if not os.path.isdir(directory):
+        return []
+    return sorted((name for name in os.listdir(directory) if name.isdigit()), key=int)
+
+
+def prune_snapshots(project: str = None, keep: int = None):
+    """
+    Delete all but the newest `keep` snapshots (never the current one), unfinished
+    staging directories, pre-snapshot files, and embedding rows no kept snapshot uses.
+    Readers still holding a deleted snapshot keep their open index and mmap.
+    """
+    keep = keep or SNAPSHOTS_KEEP
+    paths = kb_paths(project)
+    current = read_index_version(project)
+    versions = list_snapshots(project)
+    kept = set(versions[-keep:]) | ({current} if current in versions else set())
+
+    for name in os.listdir(paths["snapshots"]):
+        if name not in kept:
+            shutil.rmtree(os.path.join(paths["snapshots"], name), ignore_errors=True)
+    if kept:
+        for key in ("index", "chunks", "manifest"):
+            if os.path.exists(paths[key]):
+                os.remove(paths[key])
+
+    used = set()
+    for version in kept:
+        manifest = load_manifest(snapshot_paths(project, version)["manifest"])
+        used.update(entry["rows"] for entry in manifest["files"].values())
+    if os.path.isdir(paths["embeddings"]):
+        for name in os.listdir(paths["embeddings"]):
+            if not name.endswith(".f32") or name[:-len(".f32")] not in used:
+                os.remove(os.path.join(paths["embeddings"], name))
+
+
+def rollback_index(project: str = None, version: str = None) -> Dict[str, Any]:
+    """
+    Point the project back at a kept snapshot: `version`, or the one before
+    the current one. Raises ValueError if there is no such snapshot.
+    """
+    with _publish_lock:
+        versions = list_snapshots(project)
+        current = read_index_version(project)
+        if version is None:
+            older = [v for v in versions if current is None or int(v) < int(current)]
+            if not older:
+                raise ValueError("No older snapshot to roll back to")
+            version = older[-1]
+        elif version not in versions:
+            raise ValueError(f"Unknown snapshot '{version}' (kept: {', '.join(versions) or 'none'})")
+        publish_index_version(version, project)
+    return {"project": project_name(project), "version": version, "previous": current}
+
+
+def current_manifest(project: str = None) -> Dict[str, Any]:
+    """Manifest of the snapshot the project currently points at."""
+    return load_manifest(snapshot_paths(project, read_index_version(project))["manifest"])
+
+
+def read_index_version(project: str = None):
+    try:
+        with open(kb_paths(project)["version"], "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def get_resident_index(project: str = None):
+    """
+    Return (version, index, chunks) of a project, kept in process memory.
+    Reloads from disk only when a rebuild has published a new version.
+    """
+    project = project_name(project)
+    version = read_index_version(project)
+    current = resident_indexes.get(project)
+    if current is not None and current[0] == version:
+        return current[:3]
+
+    with _resident_lock:
+        lock = _resident_locks.setdefault(project, threading.Lock())
+
+    with lock:
+        # Another thread may have reloaded while we waited
+        current = resident_indexes.get(project)
+        if current is not None and current[0] == version:
+            return current[:3]
+
+        # Snapshots never change once published; only a snapshot pruned before
+        # we opened it (several publishes in between) makes us follow the pointer again
+        for _ in range(3):
+            with timed("index_load"):
+                index, chunks = load_faiss_index(project, version)
+            loaded_version = read_index_version(project)
+            if index is not None or loaded_version == version:
+                break
+            version = loaded_version
+
+        size = os.path.getsize(snapshot_paths(project, version)["index"]) if index is not None else 0
+        resident_indexes.put(project, (version, index, chunks, size))
+        return version, index, chunks
+
+
+def search_chunks(query: str, top_k=5, nprobe: int = None, ef_search: int = None,
+                  sources: Iterable[str] = None, project: str = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Search a project's FAISS db and return nearest chunks with provenance:
+    [{"id", "text", "distance", "source", "doc_type", "start", "end"}].
+    nprobe (IVF) and ef_search (HNSW) trade recall for latency; None uses the defaults.
+    sources restricts results to chunks of those source files.
+    Returns None if no knowledge base has been built.
+    """
+    results = search_chunks_batch([query], top_k, nprobe, ef_search, sources, project)
+    return None if results is None else results[0]
+
+
+def search_chunks_batch(queries: List[str], top_k=5, nprobe: int = None, ef_search: int = None,
+                        sources: Iterable[str] = None, project: str = None) -> Optional[List[List[Dict[str, Any]]]]:
+    """
+    search_chunks() for many queries: queries not answered from the result
+    cache are embedded in one batch and searched with one index.search over
+    the query matrix. Returns one result list per query, or None without a
+    knowledge base.
+    """
+    project = project_name(project)
+    version, index, chunks = get_resident_index(project)
     if index is None:
+        return None
+
+    sources = frozenset(sources) if sources is not None else None
+    keys = [(project, version, query, top_k, nprobe, ef_search, sources) for query in queries]
+    answers = [search_result_cache.get(key) for key in keys]
+    missing = [i for i, cached in enumerate(answers) if cached is None]
+
+    if missing:
+        found = None
+        if sources is not None:
+            allowed = source_chunk_ids(version, sources, project)
+            if not len(allowed):
+                return [[] for _ in queries]
+        query_vectors = embed_queries([queries[i] for i in missing])
+
+        with timed("faiss_search"):
+            if sources is not None:
+                # ANN candidates (HNSW neighbours, probed IVF lists) could miss the
+                # allowed chunks entirely, so a restricted set is searched exactly
+                found = exact_search(query_vectors, version, sources, top_k, project)
+            if found is None:
+                kind = index_kind(index)
+                k = top_k
+                sel = None
+                if sources is not None:
+                    if supports_selector(kind):
+                        sel = faiss.IDSelectorBatch(len(allowed), faiss.swig_ptr(allowed))
+                    else:
+                        k = min(index.ntotal, top_k * FILTER_OVERFETCH)
+                found = index.search(query_vectors, k, params=search_params(kind, nprobe, ef_search, sel))
+        distances, indices = found
+
+        for row, i in enumerate(missing):
+            results = []
+            for idx, dist in zip(indices[row], distances[row]):
+                chunk = chunks.get(int(idx)) if idx != -1 else None
+                if chunk is None or (sources is not None and chunk["source"] not in sources):
+                    continue
+                results.append({"id": int(idx), "distance": float(dist), **chunk})
+                if len(results) == top_k:
+                    break
+            search_result_cache.put(keys[i], results)
+            answers[i] = results
+
+    return [[dict(r) for r in results] for results in answers]
+
+
+def exact_search(query_vectors: np.ndarray, version, sources: Iterable[str], top_k: int,
+                 project: str = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Brute-force squared-L2 search (as IndexFlatL2) over the stored embedding
+    rows of the given sources, one file at a time. Returns (distances, ids)
+    padded with -1 like index.search, or None if any file's rows are missing.
+    """
+    files = indexed_sources(version, project)
+    embeddings_dir = kb_paths(project)["embeddings"]
+    n = len(query_vectors)
+    query_norms = (query_vectors ** 2).sum(axis=1, keepdims=True)
+    best_d = np.empty((n, 0), dtype="float32")
+    best_i = np.empty((n, 0), dtype="int64")
+
+    for path in sources:
+        entry = files.get(path)
+        if entry is None or not entry["chunk_ids"]:
+            continue
+        rows = stored_rows(entry["rows"], len(entry["chunk_ids"]), embeddings_dir)
+        if rows is None:
+            return None
+        dist = query_norms - 2 * query_vectors @ rows.T + (rows ** 2).sum(axis=1)
+        ids = np.broadcast_to(np.asarray(entry["chunk_ids"], dtype="int64"), dist.shape)
+        best_d = np.hstack([best_d, dist.astype("float32")])
+        best_i = np.hstack([best_i, ids])
+        if best_d.shape[1] > top_k:
+            keep = np.argpartition(best_d, top_k - 1, axis=1)[:, :top_k]
+            best_d = np.take_along_axis(best_d, keep, axis=1)
+            best_i = np.take_along_axis(best_i, keep, axis=1)
+
+    order = np.argsort(best_d, axis=1, kind="stable")
+    best_d = np.take_along_axis(best_d, order, axis=1)
+    best_i = np.take_along_axis(best_i, order, axis=1)
+    pad = top_k - best_d.shape[1]
+    if pad > 0:
+        best_d = np.hstack([best_d, np.full((n, pad), np.inf, dtype="float32")])
+        best_i = np.hstack([best_i, np.full((n, pad), -1, dtype="int64")])
+    return np.maximum(best_d, 0), best_i
+
+
+def indexed_sources(version=None, project: str = None) -> Dict[str, Dict[str, Any]]:
+    """Manifest file entries of the project's index version being served, {path: entry}."""
+    project = project_name(project)
+    version = version if version is not None else get_resident_index(project)[0]
+    manifest = manifest_cache.get((project, version))
+    if manifest is None:
+        manifest = load_manifest(snapshot_paths(project, version)["manifest"])
+        manifest_cache.put((project, version), manifest)
+    return manifest["files"]
+
+
+def source_chunk_ids(version, sources: Iterable[str], project: str = None) -> np.ndarray:
+    files = indexed_sources(version, project)
+    ids = [files[path]["chunk_ids"] for path in sources if path in files]
+    return np.asarray(sorted(i for file_ids in ids for i in file_ids), dtype="int64")
+
+
+def stored_rows(rows_key: str, num_chunks: int, embeddings_dir: str) -> Optional[np.ndarray]:
+    """Memory-mapped embedding rows of one file (rows are keyed by content, so never change)."""
+    path = embeddings_path(rows_key, embeddings_dir)
+    rows = rows_cache.get(path)
+    if rows is None:
+        if not os.path.exists(path) or not num_chunks:
+            return None
+        rows = np.memmap(path, dtype="float32", mode="r")
+        if rows.size % num_chunks:
+            return None
+        rows = rows.reshape(num_chunks, -1)
+        rows_cache.put(path, rows)
+    return rows
+
+
+def chunk_embeddings(results: List[Dict[str, Any]], project: str = None) -> Optional[np.ndarray]:
+    """
+    Stored embeddings of search results, looked up by source file and chunk id
+    instead of re-encoding their text. None if any of them is not stored.
+    """
+    files = indexed_sources(project=project)
+    embeddings_dir = kb_paths(project)["embeddings"]
+    file_ids = {}
+    vectors = []
+    for chunk in results:
+        entry = files.get(chunk["source"])
+        if entry is None:
+            return None
+        if chunk["source"] not in file_ids:
+            file_ids[chunk["source"]] = np.asarray(entry["chunk_ids"], dtype="int64")
+        ids = file_ids[chunk["source"]]
+        pos = int(np.searchsorted(ids, chunk["id"]))
+        rows = stored_rows(entry["rows"], len(ids), embeddings_dir)
+        if rows is None or pos >= len(ids) or ids[pos] != chunk["id"]:
+            return None
+        vectors.append(rows[pos])
+    return np.vstack(vectors).astype("float32") if vectors else None
+
+
+def page_scope(pages: Iterable[str], project: str = None) -> set:
+    """Sources to search for test cases on the given HTML pages: those pages plus every non-HTML document."""
+    files = indexed_sources(project=project)
+    return set(pages) | {path for path, entry in files.items() if entry["doc_type"] != "html"}
+
+
+def embed_query(query: str) -> np.ndarray:
+    """(1, dim) query embedding, cached per model and query text."""
+    return embed_queries([query])
+
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """(n, dim) query embeddings; the ones not cached are encoded in a single batch."""
+    keys = [(EMBEDDING_MODEL_NAME, query) for query in queries]
+    rows = [query_embedding_cache.get(key) for key in keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+
+    if missing:
+        with timed("query_embedding"):
+            encoded = np.asarray(get_embedding_model().encode([queries[i] for i in missing]), dtype="float32")
+        QUERIES_EMBEDDED.inc(len(missing))
+        for row, i in enumerate(missing):
+            rows[i] = encoded[row:row + 1]
+            query_embedding_cache.put(keys[i], rows[i])
+
+    return np.vstack(rows)
+
+
+def cache_stats():
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "search_results": search_result_cache.stats(),
+        "resident_indexes": resident_indexes.stats()
+    }
+
+
+def search_vector_db(query: str, top_k=5, nprobe: int = None, ef_search: int = None,
+                     project: str = None) -> List[Tuple[str, float]]:
+    """Search FAISS db and return nearest chunks as (text, distance)."""
+
+    results = search_chunks(query, top_k, nprobe, ef_search, project=project)
+    if results is None:
         return ["Vector DB not found. Build knowledge base first."]
 
-    # embed query
-    query_emb = embedding_model.encode([query])
+    return [(r["text"], r["distance"]) for r in results]
 
-    # search FAISS
-    distances, indices = index.search(query_emb, top_k)
 
-    results = []
-    for idx, dist in zip(indices[0], distances[0]):
-        results.append((chunks[idx], float(dist)))
+def warm_up(project: str = None):
+    """Load the embedding model and a project's resident index ahead of the first query."""
+    get_embedding_model()
+    get_resident_index(project)
 
-    return results
+
+def status():
+    """Which retrieval components are loaded in this process."""
+    loaded = {project: resident[0] for project, resident in resident_indexes.items() if resident[1] is not None}
+    return {
+        "embedding_model": _embedding_model is not None,
+        "index": bool(loaded),
+        "index_versions": loaded
+    }
@@ -0,0 +1,140 @@
+"""
+Recall-vs-latency report for the approximate index types against the exact
+flat baseline.
+
+    python -m benchmarks.ann_recall --synthetic 100000      # clustered random vectors
+    python -m benchmarks.ann_recall --from-kb               # rows stored by update_faiss_index
+    python -m benchmarks.ann_recall --from-kb --project shop  # ... of another project
+
+Writes a JSON report (one row per index type / search setting) and prints a table.
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from backend.index_types import build_index, search_params, resolve_index_type
+from backend.projects import kb_paths
+from backend.vector_store import load_embeddings, current_manifest
+
+NPROBE_SWEEP = [1, 4, 8, 16, 32, 64]
+EF_SEARCH_SWEEP = [16, 32, 64, 128, 256]
+
+
+def synthetic_rows(n: int, dim: int, clusters: int = 200, seed: int = 0):
+    """Clustered, normalised vectors, roughly shaped like sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype("float32")
+    rows = centers[rng.integers(0, clusters, n)] + 0.35 * rng.normal(size=(n, dim)).astype("float32")
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows.astype("float32")
+
+
+def kb_rows(project: str = None):
+    """All embedding rows of the snapshot a project's knowledge base currently serves."""
+    embeddings_dir = kb_paths(project)["embeddings"]
+    blocks = []
+    for entry in current_manifest(project)["files"].values():
+        rows = load_embeddings(entry["rows"], len(entry["chunk_ids"]), embeddings_dir)
+        if rows is not None:
+            blocks.append(rows)
+    if not blocks:
+        raise SystemExit("No stored embedding rows. Build the knowledge base first.")
+    return np.vstack(blocks).astype("float32")
+
+
+def time_queries(index, queries, k, params):
+    """Search one query at a time (like the API does); returns ids + per-query ms."""
+    ids = np.empty((len(queries), k), dtype="int64")
+    latencies = []
+    for i, q in enumerate(queries):
+        started = time.perf_counter()
+        _, found = index.search(q[None, :], k, params=params)
+        latencies.append((time.perf_counter() - started) * 1000)
+        ids[i] = found[0]
+    return ids, np.asarray(latencies)
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(rows, num_queries: int, k: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    queries = rows[rng.choice(len(rows), num_queries, replace=False)]
+    queries = queries + 0.05 * rng.normal(size=queries.shape).astype("float32")
+    ids = np.arange(len(rows), dtype="int64")
+
+    def blocks():
+        return iter([(ids, rows)])
+
+    report = []
+    truth = None
+
+    for index_type in ["flat", "ivf_flat", "ivf_pq", "hnsw"]:
+        resolved = resolve_index_type(len(rows), index_type)
+        if resolved != index_type:
+            print(f"skipping {index_type}: too few rows ({len(rows)}) to train")
+            continue
+
+        started = time.perf_counter()
+        index = build_index(index_type, blocks, len(rows))
+        build_seconds = time.perf_counter() - started
+        size_bytes = faiss.serialize_index(index).nbytes
+
+        if index_type in ("ivf_flat", "ivf_pq"):
+            settings = [{"nprobe": n} for n in NPROBE_SWEEP]
+        elif index_type == "hnsw":
+            settings = [{"ef_search": ef} for ef in EF_SEARCH_SWEEP]
+        else:
+            settings = [{}]
+
+        for setting in settings:
+            found, latencies = time_queries(index, queries, k, search_params(index_type, **setting))
+            if truth is None:
+                truth = found
+            report.append({
+                "index_type": index_type,
+                **setting,
+                "recall_at_k": round(recall_at_k(found, truth), 4),
+                "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+                "latency_ms_p99": round(float(np.percentile(latencies, 99)), 4),
+                "build_seconds": round(build_seconds, 2),
+                "index_mb": round(size_bytes / 1e6, 1)
+            })
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", type=int, metavar="N", help="use N clustered random vectors")
+    source.add_argument("--from-kb", action="store_true", help="use the stored knowledge-base embeddings")
+    parser.add_argument("--project", default=None, help="knowledge base for --from-kb (default project if omitted)")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic vector dimension (MiniLM: 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=6)
+    parser.add_argument("--out", default="ann_recall_report.json")
+    args = parser.parse_args()
+
+    rows = synthetic_rows(args.synthetic, args.dim) if args.synthetic else kb_rows(args.project)
+    report = run(rows, min(args.queries, len(rows)), args.k)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"num_vectors": len(rows), "dim": rows.shape[1], "k": args.k, "results": report}, f, indent=2)
+
+    print(f"{len(rows)} vectors, dim {rows.shape[1]}, recall@{args.k} vs flat")
+    print(f"{'index':<9} {'setting':<14} {'recall':>7} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'MB':>7}")
+    for r in report:
+        setting = f"nprobe={r['nprobe']}" if "nprobe" in r else f"efSearch={r['ef_search']}" if "ef_search" in r else "-"
+        print(f"{r['index_type']:<9} {setting:<14} {r['recall_at_k']:>7} {r['latency_ms_p50']:>8} "
+              f"{r['latency_ms_p99']:>8} {r['build_seconds']:>8} {r['index_mb']:>7}")
+    print(f"report written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Offline stand-ins for the two networked dependencies, for benchmarks:
+
+    HashEmbedder   deterministic feature-hashing embedder (no model download)
+    StubProvider   LLM provider returning canned test cases / Selenium code
+                   after a configurable latency, with streaming support
+
+install_hash_embedder() / install_stub_llm() plug them in through the lazy
+embedding-model slot and the provider registry, so every other code path
+runs unchanged.
+"""
+import re
+import json
+import asyncio
+import hashlib
+
+import numpy as np
+
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+class HashEmbedder:
+    """
+    Bag-of-words feature hashing into `dim` buckets, L2-normalised. Identical
+    text always gives the same vector and shared words give similar ones,
+    which is enough to exercise retrieval realistically.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.tokenizer = None
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype="float32")
+        for word in TOKEN.findall(text.lower()):
+            h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+        return np.vstack([self._vector(t) for t in texts]) if len(texts) else np.zeros((0, self.dim), "float32")
+
+
+def canned_test_cases(n: int = 5) -> str:
+    return json.dumps({"test_cases": [
+        {
+            "id": f"TC{i + 1:03d}",
+            "page": "page_000.html",
+            "type": "positive" if i % 2 == 0 else "negative",
+            "input": f"Scenario {i + 1}: apply discount code and check out",
+            "steps": ["Open the checkout page", "Enter discount code SAVE10", "Click Pay Now"],
+            "expected_output": "Total is reduced by 10% and payment succeeds"
+        }
+        for i in range(n)
+    ]}, indent=2)
+
+
+CANNED_SELENIUM = """from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+driver = webdriver.Chrome()
+try:
+    driver.get("file:///checkout.html")
+    WebDriverWait(driver, 10).until(EC.presence_of_element_located((By.ID, "discount")))
+    driver.find_element(By.ID, "discount").send_keys("SAVE10")
+    driver.find_element(By.ID, "pay-now").click()
+    assert "Payment Successful" in driver.page_source
+finally:
+    driver.quit()
+"""
+
+
+def _usage(text: str, prompt_chars: int):
+    return {
+        "prompt_tokens": prompt_chars // 4,
+        "output_tokens": len(text) // 4,
+        "total_tokens": (prompt_chars + len(text)) // 4
+    }
+
+
+class StubProvider:
+    """
+    LLM provider (see backend/llm_providers.py) that answers after `latency`
+    seconds: Selenium code for Selenium prompts, a test_cases JSON object
+    otherwise. Streams in `stream_pieces` deltas spread over the same latency.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float = 0.5, num_cases: int = 5, stream_pieces: int = 20):
+        self.latency = latency
+        self.num_cases = num_cases
+        self.stream_pieces = stream_pieces
+        self.calls = 0
+
+    def _text(self, prompt: str) -> str:
+        return CANNED_SELENIUM if "Selenium" in prompt else canned_test_cases(self.num_cases)
+
+    async def generate(self, model_name: str, prompt: str, config: dict):
+        self.calls += 1
+        text = self._text(prompt)
+        await asyncio.sleep(self.latency)
+        return text, _usage(text, len(prompt))
+
+    async def stream(self, model_name: str, prompt: str, config: dict):
+        self.calls += 1
+        text = self._text(prompt)
+        delay = self.latency / (self.stream_pieces + 1)
+        await asyncio.sleep(delay)
+        step = max(1, len(text) // self.stream_pieces)
+        for i in range(0, len(text), step):
+            await asyncio.sleep(delay)
+            yield text[i:i + step], _usage(text, len(prompt))
+
+    def loaded(self):
+        return ["canned"] if self.calls else []
+
+
+def install_hash_embedder(dim: int = 384) -> HashEmbedder:
+    from backend import vector_store
+
+    embedder = HashEmbedder(dim)
+    vector_store._embedding_model = embedder
+    vector_store.EMBEDDING_MODEL_NAME = f"hash-embedder-{dim}"
+    return embedder
+
+
+def install_stub_llm(latency: float = 0.5, num_cases: int = 5) -> StubProvider:
+    """Serve every task model from a StubProvider (registered as the default provider)."""
+    from backend import llm_providers
+
+    provider = StubProvider(latency, num_cases)
+    llm_providers.register_provider("stub", provider)
+    llm_providers.LLM_PROVIDER = "stub"
+    return provider
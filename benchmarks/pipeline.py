@@ -0,0 +1,260 @@
+"""
+Offline benchmark of the whole pipeline: no network, no model download.
+The LLM is a stub with configurable latency and the embedder is a
+deterministic feature-hashing one (--real-embedder uses the configured
+SentenceTransformer instead). Runs in a scratch directory.
+
+    python -m benchmarks.pipeline                          # defaults
+    python -m benchmarks.pipeline --docs 200 --requests 100 --concurrency 16 --llm-latency 0.8
+
+Measures ingest throughput, search_vector_db latency, extract_first_json
+throughput and end-to-end /generate_test_cases latency under concurrent
+load, and writes them as JSON for regression tracking.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+
+import numpy as np
+
+WORDS = (
+    "checkout cart discount code coupon shipping express standard payment card paypal email "
+    "name address validation error total price item quantity order confirm submit required "
+    "invalid expired success message button field form user login password account"
+).split()
+
+
+def percentiles(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        "count": int(samples.size),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+        "mean_ms": round(float(samples.mean()), 3)
+    }
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def write_corpus(root: str, num_docs: int, num_pages: int, paragraphs: int, seed: int = 0):
+    """Synthetic HTML pages plus a mix of markdown, text and JSON support docs."""
+    rng = random.Random(seed)
+    html_dir = os.path.join(root, "data", "html")
+    docs_dir = os.path.join(root, "data", "uploads")
+    os.makedirs(html_dir, exist_ok=True)
+    os.makedirs(docs_dir, exist_ok=True)
+
+    for p in range(num_pages):
+        fields = "\n".join(
+            f'<label for="f{p}_{i}">{rng.choice(WORDS)} {rng.choice(WORDS)}</label>'
+            f'<input id="f{p}_{i}" name="{rng.choice(WORDS)}_{i}" type="text">'
+            for i in range(12)
+        )
+        with open(os.path.join(html_dir, f"page_{p:03d}.html"), "w", encoding="utf-8") as f:
+            f.write(f"<html><head><title>Page {p}</title></head><body><h1>{sentence(rng, 4)}</h1>"
+                    f"<form id=\"form{p}\">{fields}<button type=\"submit\" id=\"submit{p}\">Submit</button></form>"
+                    f"<p>{sentence(rng, 40)}</p></body></html>")
+
+    for d in range(num_docs):
+        kind = d % 3
+        paras = [" ".join(sentence(rng, rng.randint(8, 20)) for _ in range(4)) for _ in range(paragraphs)]
+        if kind == 0:
+            name, text = f"spec_{d:04d}.md", "\n\n".join(f"## {sentence(rng, 3)}\n\n{p}" for p in paras)
+        elif kind == 1:
+            name, text = f"notes_{d:04d}.txt", "\n\n".join(paras)
+        else:
+            name, text = f"rules_{d:04d}.json", json.dumps(
+                {"rules": [{"id": i, "field": rng.choice(WORDS), "rule": p} for i, p in enumerate(paras)]}, indent=2
+            )
+        with open(os.path.join(docs_dir, name), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    return html_dir, docs_dir
+
+
+def bench_ingest(html_dir, docs_dir, workers):
+    from backend.vector_store import update_faiss_index
+
+    started = time.perf_counter()
+    info = update_faiss_index(html_dir, docs_dir, workers=workers)
+    seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    update_faiss_index(html_dir, docs_dir, workers=workers)
+    noop_seconds = time.perf_counter() - started
+
+    num_files = len(info["added"])
+    return {
+        "files": num_files,
+        "chunks": info["num_chunks"],
+        "index_type": info["index_type"],
+        "seconds": round(seconds, 3),
+        "docs_per_second": round(num_files / seconds, 2),
+        "chunks_per_second": round(info["num_chunks"] / seconds, 2),
+        "unchanged_rebuild_seconds": round(noop_seconds, 3)
+    }
+
+
+def bench_search(num_queries, k, seed=0):
+    from backend.vector_store import search_vector_db, get_resident_index
+
+    rng = random.Random(seed)
+    get_resident_index()
+    queries = [" ".join(rng.choice(WORDS) for _ in range(6)) + f" {i}" for i in range(num_queries)]
+
+    def timed(batch):
+        samples = []
+        for q in batch:
+            started = time.perf_counter()
+            search_vector_db(q, top_k=k)
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+
+    cold = timed(queries)
+    warm = timed(queries)
+    return {"k": k, "uncached": percentiles(cold), "cached": percentiles(warm)}
+
+
+def bench_extract_json(iterations, num_cases):
+    from backend.rag_agent import extract_first_json
+    from benchmarks.fakes import canned_test_cases
+
+    payload = canned_test_cases(num_cases)
+    variants = {
+        "plain": payload,
+        "fenced": f"```json\n{payload}\n```",
+        "prefixed": f"Here are the test cases:\n{payload}\nLet me know if you need more."
+    }
+
+    report = {"payload_bytes": len(payload)}
+    for name, text in variants.items():
+        started = time.perf_counter()
+        for _ in range(iterations):
+            extract_first_json(text)
+        seconds = time.perf_counter() - started
+        report[name] = {
+            "ops_per_second": round(iterations / seconds, 1),
+            "mb_per_second": round(iterations * len(text) / seconds / 1e6, 2)
+        }
+    return report
+
+
+async def _load(app, num_requests, concurrency, seed=0):
+    import httpx
+
+    rng = random.Random(seed)
+    queries = [f"Generate test cases for {rng.choice(WORDS)} {rng.choice(WORDS)} {i}" for i in range(num_requests)]
+    limit = asyncio.Semaphore(concurrency)
+    samples, errors = [], 0
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=600) as client:
+        async def one(query):
+            nonlocal errors
+            async with limit:
+                started = time.perf_counter()
+                response = await client.post("/generate_test_cases", params={"query": query, "use_cache": False})
+                samples.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200 or response.json().get("parsed") is None:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(q) for q in queries))
+        wall = time.perf_counter() - started
+
+    return samples, errors, wall
+
+
+def bench_end_to_end(num_requests, concurrency, llm_latency):
+    from app import app
+
+    samples, errors, wall = asyncio.run(_load(app, num_requests, concurrency))
+    return {
+        "requests": num_requests,
+        "concurrency": concurrency,
+        "llm_latency_seconds": llm_latency,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(num_requests / wall, 2),
+        "latency": percentiles(samples)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=60, help="support documents to generate")
+    parser.add_argument("--pages", type=int, default=3, help="HTML pages to generate")
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per document")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes (default EXTRACT_WORKERS)")
+    parser.add_argument("--queries", type=int, default=500, help="search_vector_db queries")
+    parser.add_argument("-k", type=int, default=6)
+    parser.add_argument("--json-iterations", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=50, help="end-to-end /generate_test_cases requests")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub LLM seconds per call")
+    parser.add_argument("--real-embedder", action="store_true", help="use the configured SentenceTransformer")
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--out", default="benchmark_report.json")
+    args = parser.parse_args()
+
+    out_path = os.path.abspath(args.out)
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="qa-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    # Every data/ path in the backend is relative, so the run is confined to the workdir
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    os.chdir(workdir)
+    os.environ.setdefault("GEMINI_API_KEY", "offline-benchmark")
+
+    from benchmarks.fakes import install_hash_embedder, install_stub_llm
+    if not args.real_embedder:
+        install_hash_embedder()
+    install_stub_llm(args.llm_latency)
+
+    html_dir, docs_dir = write_corpus(workdir, args.docs, args.pages, args.paragraphs)
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "embedder": "sentence-transformers" if args.real_embedder else "hash",
+            "llm": "stub"
+        },
+        "settings": {k: v for k, v in vars(args).items() if k not in ("out", "workdir")}
+    }
+
+    stages = [
+        ("ingest", lambda: bench_ingest(html_dir, docs_dir, args.workers)),
+        ("search", lambda: bench_search(args.queries, args.k)),
+        ("extract_first_json", lambda: bench_extract_json(args.json_iterations, 8)),
+        ("end_to_end", lambda: bench_end_to_end(args.requests, args.concurrency, args.llm_latency))
+    ]
+    for name, stage in stages:
+        print(f"running {name} ...", file=sys.stderr)
+        report[name] = stage()
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    ingest, search, e2e = report["ingest"], report["search"], report["end_to_end"]
+    print(f"ingest      {ingest['files']} files, {ingest['chunks']} chunks in {ingest['seconds']} s "
+          f"({ingest['docs_per_second']} docs/s, {ingest['chunks_per_second']} chunks/s)")
+    print(f"search      p50 {search['uncached']['p50_ms']} ms, p99 {search['uncached']['p99_ms']} ms "
+          f"(cached p50 {search['cached']['p50_ms']} ms)")
+    print(f"json parse  {report['extract_first_json']['plain']['ops_per_second']} ops/s (plain), "
+          f"{report['extract_first_json']['prefixed']['ops_per_second']} ops/s (prefixed)")
+    print(f"end to end  {e2e['requests']} requests @ {e2e['concurrency']}: p50 {e2e['latency']['p50_ms']} ms, "
+          f"p99 {e2e['latency']['p99_ms']} ms, {e2e['requests_per_second']} req/s, {e2e['errors']} errors")
+    print(f"report written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import time
 import streamlit as st
 import requests
 
@@ -9,6 +10,9 @@ st.set_page_config(page_title="Autonomous QA Agent", layout="wide")
 st.title("Autonomous QA Agent")
 st.write("A complete pipeline: Upload → Build KB → Generate Test Cases → Generate Selenium Scripts")
 
+# Every request goes to this project's knowledge base
+project = st.sidebar.text_input("Project", value="default", help="Each project has its own knowledge base")
+
 
 tab1, tab2, tab3 = st.tabs(["Build Knowledge Base", "Generate Test Cases", "Selenium Script Generator"])
 
@@ -33,28 +37,54 @@ with tab1:
             st.error("Please upload at least one support document")
         else:
             with st.spinner("Uploading and building knowledge base..."):
-                files = {}
-
                 # HTML file
-                files["html_file"] = (html_file.name, html_file.read(), "text/html")
+                files = [("html_file", (html_file.name, html_file.read(), "text/html"))]
 
-                # Support docs
-                for i, doc in enumerate(support_docs):
-                    files[f"support_docs"] = (
+                # Support docs (a list, so every document is sent under the same field)
+                for doc in support_docs:
+                    files.append(("support_docs", (
                         doc.name,
                         doc.read(),
                         "application/octet-stream"
-                    )
+                    )))
 
                 try:
-                    response = requests.post(f"{BACKEND_URL}/upload_files", files=files)
+                    response = requests.post(f"{BACKEND_URL}/upload_files", params={"project": project}, files=files)
                 except Exception as e:
                     st.error("Could not connect to backend. Is FastAPI running?")
                     st.stop()
 
             if response.status_code == 200:
-                st.success("Knowledge Base Built Successfully!")
-                st.json(response.json())
+                # Every file was unchanged, so no build was needed
+                st.success(response.json()["message"])
+                st.json(response.json()["uploads"])
+            elif response.status_code == 202:
+                # The build runs in the background; poll its job until it finishes
+                status_url = f"{BACKEND_URL}{response.json()['status_url']}"
+                progress_bar = st.progress(0.0, text="Build queued")
+                while True:
+                    job_response = requests.get(status_url)
+                    if job_response.status_code != 200:
+                        # e.g. the job record was trimmed or is unknown to a restarted backend
+                        job = {"status": "unknown", "error": job_response.text}
+                        break
+                    job = job_response.json()
+                    if job["status"] in ("done", "failed"):
+                        break
+                    done, total = job["progress"]["done"], job["progress"]["total"]
+                    progress_bar.progress(done / total if total else 0.0, text=f"{job['stage'] or 'queued'} {done}/{total}")
+                    time.sleep(0.5)
+                progress_bar.empty()
+
+                if job["status"] == "done":
+                    st.success("Knowledge Base Built Successfully!")
+                    st.json(job["result"])
+                elif job["status"] == "unknown":
+                    st.warning("Lost track of the build job; check the knowledge base status")
+                    st.write(job["error"])
+                else:
+                    st.error("Error building knowledge base")
+                    st.write(job["error"])
             else:
                 st.error("Error building knowledge base")
                 st.write(response.text)
@@ -75,7 +105,7 @@ with tab2:
                 try:
                     response = requests.post(
                         f"{BACKEND_URL}/generate_test_cases",
-                        params={"query": user_query}
+                        params={"query": user_query, "project": project}
                     )
                 except:
                     st.error("Backend not reachable. Start FastAPI.")
@@ -131,12 +161,37 @@ with tab3:
     st.subheader("Selected Test Case")
     st.json(selected_case)
 
+    # Generate scripts for every test case in one request
+    if st.button("Generate All Scripts (.zip)"):
+        with st.spinner(f"Generating {len(test_cases)} Selenium Scripts..."):
+            try:
+                response = requests.post(
+                    f"{BACKEND_URL}/generate_selenium_scripts",
+                    params={"format": "zip", "project": project},
+                    json={"test_cases": test_cases}
+                )
+            except requests.exceptions.ConnectionError:
+                st.error("Cannot connect to backend.")
+                response = None
+
+        if response is not None and response.status_code == 200:
+            st.download_button(
+                label="Download All Scripts",
+                data=response.content,
+                file_name="selenium_scripts.zip",
+                mime="application/zip"
+            )
+        elif response is not None:
+            st.error(f"API Error: {response.status_code}")
+            st.write(response.text)
+
     # Generate script
     if st.button("Generate Selenium Script"):
         with st.spinner("Generating Selenium Script..."):
             try:
                 response = requests.post(
                     f"{BACKEND_URL}/generate_selenium_script",
+                    params={"project": project},
                     json={"test_case": selected_case}
                 )
                 
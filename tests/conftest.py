@@ -0,0 +1,39 @@
+"""
+Shared fixtures. Everything runs offline: the hash embedder stands in for the
+sentence-transformers model and the stub provider for the LLM, and every
+test gets a fresh working directory, so the relative data/ paths of the
+knowledge base land in tmp_path.
+"""
+import pytest
+
+from backend import chunker, vector_store
+from benchmarks.fakes import HashEmbedder, install_hash_embedder, install_stub_llm
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def approx_tokens(monkeypatch):
+    # HashEmbedder has no tokenizer, so chunk sizes use the word/punctuation estimate
+    monkeypatch.setattr(chunker, "_token_counter", lambda text: len(chunker.APPROX_TOKEN.findall(text)))
+
+
+@pytest.fixture
+def embedder(monkeypatch) -> HashEmbedder:
+    monkeypatch.setattr(vector_store, "_embedding_model", None)
+    monkeypatch.setattr(vector_store, "EMBEDDING_MODEL_NAME", vector_store.EMBEDDING_MODEL_NAME)
+    vector_store.resident_indexes.clear()
+    yield install_hash_embedder(64)
+    vector_store.resident_indexes.clear()
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    from backend import llm_providers
+
+    monkeypatch.setattr(llm_providers, "LLM_PROVIDER", llm_providers.LLM_PROVIDER)
+    return install_stub_llm(latency=0, num_cases=5)
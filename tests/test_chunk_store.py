@@ -0,0 +1,84 @@
+import os
+import json
+
+import numpy as np
+import pytest
+
+from backend.chunk_store import (
+    ChunkStore, ChunkStoreWriter, open_chunk_store, FOOTER, MAGIC, TABLE_DTYPE
+)
+
+
+def write_store(path, chunks):
+    writer = ChunkStoreWriter(path)
+    for chunk_id, text in chunks:
+        writer.add(chunk_id, text, source="a.md", doc_type="support", start=0, end=len(text))
+    writer.close()
+    return path
+
+
+def test_footer_points_at_sorted_offset_table(tmp_path):
+    path = write_store(str(tmp_path / "chunks.bin"), [(7, "seven"), (2, "two"), (40, "forty")])
+    data = open(path, "rb").read()
+
+    magic, table_offset, count = FOOTER.unpack_from(data, len(data) - FOOTER.size)
+    assert magic == MAGIC
+    assert count == 3
+    # The table sits between the records and the footer
+    assert table_offset + count * TABLE_DTYPE.itemsize == len(data) - FOOTER.size
+
+    table = np.frombuffer(data, dtype=TABLE_DTYPE, count=count, offset=table_offset)
+    assert list(table["id"]) == [2, 7, 40]
+    for row, text in zip(table, ["two", "seven", "forty"]):
+        offset, length = int(row["offset"]), int(row["length"])
+        record = json.loads(data[offset:offset + length])
+        assert record == {"text": text, "source": "a.md", "doc_type": "support", "start": 0, "end": len(text)}
+
+
+def test_lookup_by_id(tmp_path):
+    store = ChunkStore(write_store(str(tmp_path / "chunks.bin"), [(5, "five"), (1, "één ✓")]))
+
+    assert len(store) == 2
+    assert store[1] == "één ✓"
+    assert store.get(5)["source"] == "a.md"
+    assert store.get(3) is None
+    with pytest.raises(KeyError):
+        store[3]
+
+
+def test_copy_from_keeps_records_byte_for_byte(tmp_path):
+    old = ChunkStore(write_store(str(tmp_path / "old.bin"), [(1, "one"), (2, "two"), (3, "three")]))
+    writer = ChunkStoreWriter(str(tmp_path / "new.bin"))
+    writer.copy_from(old, [3, 1, 99])
+    writer.add(4, "four")
+    writer.close()
+
+    new = ChunkStore(str(tmp_path / "new.bin"))
+    assert list(new.table["id"]) == [1, 3, 4]
+    assert new.get_raw(1) == old.get_raw(1)
+    assert new.get_raw(3) == old.get_raw(3)
+
+
+def test_store_appears_only_on_close(tmp_path):
+    path = str(tmp_path / "chunks.bin")
+    writer = ChunkStoreWriter(path)
+    writer.add(0, "zero")
+    assert open_chunk_store(path) is None
+    writer.close()
+    assert open_chunk_store(path)[0] == "zero"
+
+
+def test_abort_discards_the_partial_store(tmp_path):
+    path = str(tmp_path / "chunks.bin")
+    writer = ChunkStoreWriter(path)
+    writer.add(0, "zero")
+    writer.abort()
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+def test_rejects_files_without_the_footer(tmp_path):
+    path = tmp_path / "chunks.bin"
+    path.write_bytes(b"x" * (FOOTER.size + 10))
+    with pytest.raises(ValueError):
+        ChunkStore(str(path))
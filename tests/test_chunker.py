@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from backend.chunker import chunk_document, count_tokens
+
+PROSE = "\n\n".join(
+    " ".join(f"Sentence {p}.{s} says the discount code SAVE{s} applies at checkout." for s in range(12))
+    for p in range(6)
+)
+
+MARKDOWN = "\n".join(
+    f"## Rule {h}\n\n" + "\n".join(f"- The field f{h}_{i} is required and must be validated." for i in range(15))
+    for h in range(5)
+)
+
+HTML_LINES = "\n".join(f"Label {i}: input#field{i} (type text, required)" for i in range(200))
+
+JSON_DOC = json.dumps({
+    "rules": {f"rule_{i}": {"field": f"f{i}", "required": True, "message": "x " * 10} for i in range(40)},
+    "version": 3
+}, indent=2)
+
+DOCUMENTS = [(PROSE, "text"), (MARKDOWN, "markdown"), (HTML_LINES, "html"), (JSON_DOC, "json")]
+KINDS = [kind for _, kind in DOCUMENTS]
+
+
+@pytest.mark.parametrize("text,kind", DOCUMENTS, ids=KINDS)
+@pytest.mark.parametrize("max_tokens", [40, 120])
+def test_chunks_are_spans_within_the_budget(text, kind, max_tokens):
+    chunks = list(chunk_document(text, kind, max_tokens=max_tokens, overlap_tokens=10))
+
+    assert len(chunks) > 1
+    for start, end, chunk in chunks:
+        assert 0 <= start < end <= len(text)
+        assert chunk == text[start:end]
+        assert count_tokens(chunk) <= max_tokens
+
+
+@pytest.mark.parametrize("text,kind", DOCUMENTS, ids=KINDS)
+def test_chunks_cover_the_text_in_order(text, kind):
+    chunks = list(chunk_document(text, kind, max_tokens=60, overlap_tokens=10))
+
+    starts = [start for start, _, _ in chunks]
+    assert starts == sorted(set(starts))
+
+    covered = bytearray(len(text))
+    for start, end, _ in chunks:
+        covered[start:end] = b"\x01" * (end - start)
+    # Only separators (whitespace, JSON punctuation between members) may fall between chunks
+    assert all(covered[i] or not text[i].isalnum() for i in range(len(text)))
+
+
+def test_overlap_stays_within_its_budget():
+    chunks = list(chunk_document(PROSE, "text", max_tokens=60, overlap_tokens=15))
+    overlaps = [text_end - next_start for (_, text_end, _), (next_start, _, _) in zip(chunks, chunks[1:])
+                if next_start < text_end]
+
+    assert overlaps
+    for (_, end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        if start < end:
+            assert count_tokens(PROSE[start:end]) <= 15
+
+
+def test_json_chunks_hold_whole_members_without_overlap():
+    chunks = list(chunk_document(JSON_DOC, "json", max_tokens=80, overlap_tokens=20))
+
+    for (_, end, _), (start, _, _) in zip(chunks, chunks[1:]):
+        assert start >= end
+    for i in range(40):
+        member = f'"rule_{i}": {{'
+        holders = [chunk for _, _, chunk in chunks if member in chunk]
+        assert len(holders) == 1
+        assert f'"field": "f{i}"' in holders[0]
+
+
+def test_unsplittable_text_is_hard_split():
+    word = "x" * 5000
+    chunks = list(chunk_document(word, "text", max_tokens=20, overlap_tokens=0))
+    assert "".join(chunk for _, _, chunk in chunks) == word
+
+    words = " ".join(["word"] * 100)
+    for _, _, chunk in chunk_document(words, "text", max_tokens=20, overlap_tokens=0):
+        assert count_tokens(chunk) <= 20
+
+
+def test_short_text_is_one_chunk():
+    assert list(chunk_document("  Pay now.  ", "text", max_tokens=50)) == [(2, 10, "Pay now.")]
+    assert list(chunk_document("   ", "text", max_tokens=50)) == []
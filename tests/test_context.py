@@ -0,0 +1,44 @@
+import os
+import asyncio
+
+import pytest
+
+from backend.projects import kb_paths
+from backend.rag_agent import agenerate_test_cases
+from backend.vector_store import update_faiss_index
+
+
+@pytest.fixture
+def kb(embedder, stub_llm):
+    os.makedirs(kb_paths()["docs_dir"])
+    with open(os.path.join(kb_paths()["docs_dir"], "rules.md"), "w", encoding="utf-8") as f:
+        f.write("# Discounts\nSAVE10 takes 10% off the total when the cart is over 50 dollars.")
+    return update_faiss_index()
+
+
+def generate(query, **kwargs):
+    return asyncio.run(agenerate_test_cases(query, use_cache=False, **kwargs))
+
+
+def test_context_within_budget_reaches_the_model(kb, stub_llm):
+    result = generate("discount code")
+    assert result["error"] is None
+    assert result["context"]["selected"] == 1
+    assert stub_llm.calls == 1
+
+
+def test_budget_too_small_is_not_reported_as_a_missing_knowledge_base(kb, stub_llm):
+    result = generate("discount code", budget=5)
+
+    assert "context budget" in result["error"]
+    assert "not ready" not in result["error"]
+    assert result["context"]["candidates"] == 1
+    assert result["context"]["selected"] == 0
+    assert result["parsed"] is None
+    assert stub_llm.calls == 0
+
+
+def test_missing_knowledge_base_is_not_ready(embedder, stub_llm):
+    result = generate("discount code")
+    assert "not ready" in result["error"]
+    assert stub_llm.calls == 0
@@ -0,0 +1,134 @@
+import uuid
+import threading
+
+import pytest
+
+from backend import jobs
+from backend.jobs import submit_build, get_job, wait_job
+
+
+def key():
+    # The build thread and the job list are shared by the whole test session
+    return uuid.uuid4().hex
+
+
+def blocked_build():
+    """A build that runs until release is set, and counts its runs."""
+    release = threading.Event()
+    runs = []
+
+    def build(progress):
+        runs.append(1)
+        progress("processing", 1, 2)
+        release.wait(5)
+        return {"runs": len(runs)}
+
+    return build, release, runs
+
+
+@pytest.fixture
+def no_debounce(monkeypatch):
+    monkeypatch.setattr(jobs, "BUILD_DEBOUNCE", 0)
+
+
+def test_submissions_within_the_debounce_window_share_one_build(monkeypatch):
+    monkeypatch.setattr(jobs, "BUILD_DEBOUNCE", 0.3)
+    runs = []
+    project = key()
+
+    first = submit_build(lambda progress: runs.append("first") or "first", key=project)
+    second = submit_build(lambda progress: runs.append("second") or "second", key=project)
+
+    assert second["id"] == first["id"] and second["submissions"] == 2
+    job = wait_job(first["id"], 5)
+    # One run, of the latest build callable, after the window of the last submission
+    assert runs == ["second"] and job["result"] == "second"
+    assert job["started"] >= job["last_submitted"] + 0.3
+
+
+def test_running_build_is_not_joined(no_debounce):
+    build, release, runs = blocked_build()
+    project = key()
+    first = submit_build(build, key=project)
+    while get_job(first["id"])["status"] != "running":
+        wait_job(first["id"], 0.01)
+
+    second = submit_build(build, key=project)
+    release.set()
+
+    assert second["id"] != first["id"]
+    assert wait_job(second["id"], 5)["status"] == "done"
+    assert len(runs) == 2
+
+
+def test_wait_returns_the_unfinished_job_on_timeout(no_debounce):
+    build, release, _ = blocked_build()
+    job = submit_build(build, key=key())
+
+    waited = wait_job(job["id"], 0.05)
+    assert waited["status"] in ("queued", "running")
+    release.set()
+    assert wait_job(job["id"], 5)["status"] == "done"
+
+
+def test_failed_build_reports_its_error(no_debounce):
+    def failing(progress):
+        raise RuntimeError("disk full")
+
+    job = wait_job(submit_build(failing, key=key())["id"], 5)
+    assert job["status"] == "failed" and job["error"] == "RuntimeError: disk full"
+
+
+def test_oldest_finished_jobs_are_trimmed(no_debounce, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_BUILD_JOBS", 2)
+    ids = [submit_build(lambda progress: None, key=key())["id"] for _ in range(4)]
+    for job_id in ids:
+        wait_job(job_id, 5)
+
+    assert get_job(ids[0]) is None and wait_job(ids[0], 0) is None
+    assert get_job(ids[-1])["status"] == "done"
+
+
+# ---------- /upload_files?wait=true ----------
+
+@pytest.fixture
+def client(no_debounce, monkeypatch):
+    from fastapi.testclient import TestClient
+    import app
+
+    build, release, _ = blocked_build()
+    monkeypatch.setattr(app, "update_faiss_index", lambda progress, project: build(progress))
+    yield TestClient(app.app), app, release
+    release.set()
+
+
+def upload(client, text):
+    return client.post("/upload_files", params={"wait": "true", "project": key()[:12]}, files=[
+        ("html_file", ("page.html", f"<html><body>{text}</body></html>", "text/html")),
+        ("support_docs", ("rules.md", f"# Rules\n{text}", "text/markdown"))
+    ])
+
+
+def test_wait_answers_504_while_the_build_is_still_running(client, monkeypatch):
+    client, app, release = client
+    monkeypatch.setattr(app, "BUILD_WAIT_TIMEOUT", 0.05)
+
+    response = upload(client, "first")
+
+    assert response.status_code == 504
+    job_id = response.json()["job_id"]
+    assert get_job(job_id)["status"] in ("queued", "running")
+    release.set()
+    assert wait_job(job_id, 5)["status"] == "done"
+
+
+def test_wait_answers_202_when_the_finished_job_was_trimmed(client, monkeypatch):
+    client, app, release = client
+    monkeypatch.setattr(jobs, "MAX_BUILD_JOBS", 0)
+    release.set()
+
+    response = upload(client, "second")
+
+    assert response.status_code == 202
+    assert "no longer kept" in response.json()["message"]
+    assert get_job(response.json()["job_id"]) is None
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from backend import llm_client
+
+
+async def drain(stream):
+    items = [item async for item in stream]
+    return items[-1]
+
+
+@pytest.fixture
+def slow_llm(stub_llm, monkeypatch):
+    # Every attempt times out; retries back off briefly
+    stub_llm.latency = 5
+    monkeypatch.setattr(llm_client, "LLM_BACKOFF_BASE", 0.01)
+    return stub_llm
+
+
+def test_retries_stop_at_the_total_timeout(slow_llm):
+    result = asyncio.run(llm_client.agenerate("canned", "PROMPT", {}, use_cache=False,
+                                              timeout=0.2, retries=10, total_timeout=0.5))
+
+    assert result["error"] == "TimeoutError"
+    assert 2 <= result["attempts"] <= 3
+    assert result["latency"] < 0.8
+
+
+def test_streaming_retries_stop_at_the_total_timeout(slow_llm):
+    result = asyncio.run(drain(llm_client.astream("canned", "PROMPT", {}, use_cache=False,
+                                                  timeout=0.2, retries=10, total_timeout=0.5)))
+
+    assert result["error"] == "TimeoutError"
+    assert 2 <= result["attempts"] <= 3
+    assert result["latency"] < 0.8
+
+
+def test_no_retry_starts_when_its_backoff_reaches_the_deadline(slow_llm, monkeypatch):
+    monkeypatch.setattr(llm_client, "backoff_delay", lambda attempt: 1.0)
+    result = asyncio.run(llm_client.agenerate("canned", "PROMPT", {}, use_cache=False,
+                                              timeout=0.2, retries=10, total_timeout=0.5))
+
+    assert result["attempts"] == 1
+    assert result["latency"] < 0.5
@@ -0,0 +1,80 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+from backend import dom_index, script_generator, metrics
+from backend.projects import kb_paths
+from backend.script_generator import load_pages, page_context, agenerate_selenium_script
+from backend.vector_store import update_faiss_index
+
+LOGIN = "<html><head><title>Sign in</title></head><body><input id='username'><input id='password'>" \
+        "<button id='signin'>Sign in</button></body></html>"
+CHECKOUT = "<html><head><title>Checkout</title></head><body><input id='discount'>" \
+           "<button id='pay'>Pay</button></body></html>"
+LOGIN_CASE = {"id": "TC001", "steps": ["Enter the username and password", "Press sign in"]}
+
+
+def write_page(name, html):
+    with open(os.path.join(kb_paths()["html_dir"], name), "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+@pytest.fixture
+def pages(embedder, monkeypatch):
+    os.makedirs(kb_paths()["html_dir"])
+    write_page("login.html", LOGIN)
+    write_page("checkout.html", CHECKOUT)
+    update_faiss_index()
+
+    # Paths of the locator indexes loaded after the build
+    loaded = []
+    real = dom_index.load_locator_index
+
+    def counting(html_path, content_hash=None):
+        loaded.append(html_path)
+        return real(html_path, content_hash)
+
+    monkeypatch.setattr(script_generator, "load_locator_index", counting)
+    monkeypatch.setattr(dom_index, "load_locator_index", counting)
+    return loaded
+
+
+def test_build_writes_the_routing_index(pages):
+    with open(kb_paths()["routing"], "r", encoding="utf-8") as f:
+        stored = json.load(f)["pages"]
+
+    assert sorted(stored) == ["checkout.html", "login.html"]
+    assert stored["login.html"]["title"] == "Sign in"
+    assert "username" in stored["login.html"]["words"]
+    assert [(p["name"], p["elements"]) for p in load_pages()["pages"]] == [("checkout.html", 2), ("login.html", 3)]
+
+
+def test_only_the_routed_page_is_loaded(pages):
+    context = page_context(LOGIN_CASE, load_pages())
+
+    assert "# Page: login.html (Sign in)" in context and "#username" in context
+    assert "checkout" not in context
+    assert [os.path.basename(path) for path in pages] == ["login.html"]
+
+
+def test_changed_page_is_rerouted_by_its_hash(pages):
+    write_page("checkout.html", CHECKOUT.replace("discount", "username"))
+    update_faiss_index()
+    routing = load_pages()
+
+    assert [os.path.basename(path) for path in pages] == ["checkout.html"]
+    routed = dom_index.route_pages({"steps": ["Enter the username"]}, routing)
+    assert "checkout.html" in [page["name"] for page in routed]
+
+
+def test_selenium_prompts_are_counted_in_tokens(pages, stub_llm):
+    def selenium_tokens():
+        return dict(metrics.PROMPT_TOKENS.values).get(metrics._label_key({"task": "selenium"}), 0)
+
+    before = selenium_tokens()
+    script, errors = asyncio.run(agenerate_selenium_script(LOGIN_CASE, use_cache=False))
+
+    assert not errors
+    assert selenium_tokens() - before > 100
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from backend.projects import kb_paths
+from backend.rag_agent import retrieval_sources, UnknownPage
+from backend.vector_store import update_faiss_index, search_chunks, indexed_sources
+
+
+@pytest.fixture
+def kb(embedder):
+    paths = kb_paths()
+    os.makedirs(paths["html_dir"])
+    os.makedirs(paths["docs_dir"])
+    with open(os.path.join(paths["html_dir"], "a.html"), "w", encoding="utf-8") as f:
+        f.write("<html><body><h1>Gamma delta</h1><input id='gamma'></body></html>")
+    # Enough unrelated chunks that the page never makes it into ANN candidates
+    for i in range(120):
+        with open(os.path.join(paths["docs_dir"], f"doc{i}.md"), "w", encoding="utf-8") as f:
+            f.write("\n\n".join(f"Alpha beta rule {i}.{j}: alpha beta applies." for j in range(10)))
+    return paths
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_source_filter_finds_the_page_on_every_index_type(kb, index_type):
+    built = update_faiss_index(index_type=index_type)
+    assert built["index_type"] == index_type
+    page = os.path.join(kb["html_dir"], "a.html")
+
+    hits = search_chunks("alpha beta", top_k=3, sources=[page])
+
+    assert hits and all(hit["source"] == page for hit in hits)
+    assert len(hits) == len(indexed_sources()[page]["chunk_ids"][:3])
+
+
+def test_filtered_results_match_an_exact_search(kb):
+    update_faiss_index(index_type="hnsw")
+    sources = [os.path.join(kb["docs_dir"], f"doc{i}.md") for i in range(3)]
+    hnsw = search_chunks("alpha beta rule 1.4", top_k=5, sources=sources)
+
+    update_faiss_index(index_type="flat")
+    flat = search_chunks("alpha beta rule 1.4", top_k=5, sources=sources)
+
+    assert [hit["id"] for hit in hnsw] == [hit["id"] for hit in flat]
+    assert [hit["distance"] for hit in hnsw] == pytest.approx([hit["distance"] for hit in flat], abs=1e-4)
+
+
+def test_page_restriction_must_name_an_indexed_page(kb):
+    # Without a knowledge base the request is reported as not ready instead
+    assert retrieval_sources("missing.html") == set()
+    update_faiss_index()
+    page = os.path.join(kb["html_dir"], "a.html")
+
+    assert page in retrieval_sources("a")
+    assert page in retrieval_sources("a.html")
+    with pytest.raises(UnknownPage, match="a.html"):
+        retrieval_sources("missing.html")
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from backend import vector_store
+from backend.projects import kb_paths
+from backend.vector_store import (
+    update_faiss_index, list_snapshots, read_index_version, rollback_index, current_manifest,
+    search_chunks
+)
+
+
+def write_source(project, name, text):
+    paths = kb_paths(project)
+    directory = paths["html_dir"] if name.endswith(".html") else paths["docs_dir"]
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def sources(project=None):
+    return sorted(os.path.basename(path) for path in current_manifest(project)["files"])
+
+
+@pytest.fixture
+def kb(embedder):
+    write_source(None, "checkout.html", "<html><body><input id='discount'><button id='pay'>Pay</button></body></html>")
+    write_source(None, "rules.md", "# Discounts\nSAVE10 takes 10% off the total.")
+    return update_faiss_index()
+
+
+def test_build_publishes_a_snapshot(kb):
+    assert list_snapshots() == [kb["version"]]
+    assert read_index_version() == kb["version"]
+    assert sources() == ["checkout.html", "rules.md"]
+    # Nothing left in staging, nothing in the pre-snapshot layout
+    assert os.listdir(kb_paths()["snapshots"]) == [kb["version"]]
+    assert not os.path.exists(kb_paths()["index"])
+
+    hits = search_chunks("SAVE10 discount", top_k=1)
+    assert hits[0]["source"].endswith("rules.md")
+
+
+def test_unchanged_update_keeps_the_snapshot(kb):
+    again = update_faiss_index()
+    assert again["version"] == kb["version"]
+    assert again["unchanged"] and not again["added"]
+    assert list_snapshots() == [kb["version"]]
+
+
+def test_rollback_serves_the_previous_snapshot(kb):
+    write_source(None, "shipping.md", "# Shipping\nExpress shipping costs 10 dollars.")
+    newer = update_faiss_index()
+    assert list_snapshots() == [kb["version"], newer["version"]]
+    assert "shipping.md" in sources()
+
+    rolled = rollback_index()
+    assert rolled == {"project": "default", "version": kb["version"], "previous": newer["version"]}
+    assert read_index_version() == kb["version"]
+    assert sources() == ["checkout.html", "rules.md"]
+    assert not any(hit["source"].endswith("shipping.md") for hit in search_chunks("express shipping", top_k=5))
+
+    rollback_index(version=newer["version"])
+    assert "shipping.md" in sources()
+
+
+def test_rollback_to_unknown_or_missing_snapshot_fails(kb):
+    with pytest.raises(ValueError):
+        rollback_index(version="123")
+    with pytest.raises(ValueError):
+        rollback_index()
+    assert read_index_version() == kb["version"]
+
+
+def test_old_snapshots_and_their_rows_are_pruned(kb, monkeypatch):
+    monkeypatch.setattr(vector_store, "SNAPSHOTS_KEEP", 2)
+    versions = [kb["version"]]
+    for i in range(3):
+        write_source(None, "rules.md", f"# Discounts\nSAVE{i} takes {i}% off the total.")
+        versions.append(update_faiss_index()["version"])
+
+    assert list_snapshots() == versions[-2:]
+    rows = {entry["rows"] for v in versions[-2:]
+            for entry in vector_store.load_manifest(vector_store.snapshot_paths(None, v)["manifest"])["files"].values()}
+    stored = {name[:-len(".f32")] for name in os.listdir(kb_paths()["embeddings"])}
+    assert stored == rows
+
+
+def test_failed_build_leaves_no_staging_directory(kb, monkeypatch):
+    write_source(None, "faq.md", "# FAQ\nCards are charged at checkout.")
+
+    def failing_embed(spans):
+        raise RuntimeError("embedding failed")
+
+    monkeypatch.setattr(vector_store, "embed_batches", failing_embed)
+    with pytest.raises(RuntimeError):
+        update_faiss_index()
+
+    assert os.listdir(kb_paths()["snapshots"]) == [kb["version"]]
+    assert read_index_version() == kb["version"]
+
+
+def test_projects_publish_independently(kb):
+    write_source("shop", "catalog.md", "# Catalog\nThe blue mug costs 12 dollars.")
+    shop = update_faiss_index(project="shop")
+
+    assert shop["project"] == "shop"
+    assert list_snapshots("shop") == [shop["version"]]
+    assert sources("shop") == ["catalog.md"]
+    assert read_index_version() == kb["version"]
+    assert sources() == ["checkout.html", "rules.md"]
@@ -0,0 +1,69 @@
+import json
+import asyncio
+
+from backend import rag_agent
+from backend.rag_agent import salvage_test_cases, next_case_id, arecover_truncated
+from benchmarks.fakes import canned_test_cases
+
+
+def feed_in_pieces(text, size):
+    # Not imported by name: pytest would try to collect it as a test class
+    parser = rag_agent.TestCaseStreamParser()
+    items = []
+    for i in range(0, len(text), size):
+        items.extend(parser.feed(text[i:i + size]))
+    return items
+
+
+def test_cases_close_one_by_one_however_the_text_is_split():
+    text = canned_test_cases(4)
+    expected = json.loads(text)["test_cases"]
+    for size in (1, 3, 17, len(text)):
+        assert feed_in_pieces(text, size) == expected
+
+
+def test_bare_array_and_braces_inside_strings():
+    text = '[{"id": "TC001", "input": "a } and a {"}, {"id": "TC002", "steps": ["[x]"]}]'
+    assert [c["id"] for c in feed_in_pieces(text, 5)] == ["TC001", "TC002"]
+
+
+def test_nested_objects_are_not_returned_on_their_own():
+    text = '{"test_cases": [{"id": "TC001", "data": {"code": "SAVE10"}}]}'
+    assert feed_in_pieces(text, 4) == [{"id": "TC001", "data": {"code": "SAVE10"}}]
+
+
+def test_salvage_keeps_complete_cases_of_a_truncated_reply():
+    text = canned_test_cases(5)
+    cut = text.index('"id": "TC004"') + 20
+    cases = salvage_test_cases(text[:cut])
+    assert [c["id"] for c in cases] == ["TC001", "TC002", "TC003"]
+    assert salvage_test_cases("") == []
+
+
+def test_next_case_id_keeps_prefix_and_padding():
+    assert next_case_id([{"id": "TC007"}]) == "TC008"
+    assert next_case_id([{"id": "case-99"}]) == "case-100"
+    assert next_case_id([]) == "TC001"
+
+
+def test_truncated_reply_is_continued_not_regenerated(stub_llm):
+    text = canned_test_cases(5)
+    truncated = text[:text.index('"id": "TC003"') + 10]
+    result = {"raw_llm": truncated, "parsed": None, "error": "JSON parsing failed"}
+
+    result = asyncio.run(arecover_truncated(result, "PROMPT", use_cache=False))
+
+    assert result["error"] is None
+    # TC001-TC002 salvaged; the stub's full reply adds the rest, repeats are dropped
+    assert [c["id"] for c in result["parsed"]["test_cases"]] == [f"TC00{i}" for i in range(1, 6)]
+    assert result["continuation"]["salvaged"] == 2
+    assert result["continuation"]["added"] == 3
+    assert result["continuation"]["complete"] is True
+    assert len(result["continuation"]["requests"]) == 1
+    assert stub_llm.calls == 1
+
+
+def test_nothing_salvaged_leaves_the_result_alone(stub_llm):
+    result = {"raw_llm": '{"test_cases": [{"id": "TC0', "parsed": None, "error": "JSON parsing failed"}
+    assert asyncio.run(arecover_truncated(dict(result), "PROMPT", use_cache=False)) == result
+    assert stub_llm.calls == 0
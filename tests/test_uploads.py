@@ -0,0 +1,130 @@
+import io
+import os
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from backend import manifest, uploads
+from backend.projects import kb_paths
+from backend.uploads import save_upload, publish_uploads, RequestSizeLimit
+
+
+class Upload:
+    """The part of starlette's UploadFile that save_upload uses."""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.file = io.BytesIO(data)
+
+    async def read(self, n=-1):
+        return self.file.read(n)
+
+
+def upload(dest_dir, filename, data):
+    saved = asyncio.run(save_upload(Upload(filename, data), str(dest_dir)))
+    publish_uploads([saved])
+    return saved
+
+
+def test_reupload_is_a_duplicate_without_rehashing(tmp_path, monkeypatch):
+    first = upload(tmp_path, "rules.md", b"SAVE10 takes 10% off.")
+    assert not first["duplicate"]
+
+    def no_rehash(path):
+        raise AssertionError(f"{path} was hashed again")
+
+    monkeypatch.setattr(manifest, "file_sha256", no_rehash)
+    again = upload(tmp_path, "rules.md", b"SAVE10 takes 10% off.")
+    assert again["duplicate"] and again["tmp_path"] is None
+    assert not upload(tmp_path, "rules.md", b"SAVE20 takes 20% off.")["duplicate"]
+
+
+def test_file_changed_on_disk_is_hashed_again(tmp_path):
+    upload(tmp_path, "rules.md", b"SAVE10 takes 10% off.")
+    path = tmp_path / "rules.md"
+    path.write_bytes(b"SAVE99 takes 99% off.")
+    os.utime(path, ns=(0, 0))
+
+    assert not upload(tmp_path, "rules.md", b"SAVE10 takes 10% off.")["duplicate"]
+    assert path.read_bytes() == b"SAVE10 takes 10% off."
+
+
+# ---------- request size limit ----------
+
+@pytest.fixture
+def limited():
+    received = []
+    echo = FastAPI()
+
+    @echo.post("/upload_files")
+    async def read_body(request: Request):
+        received.append(len(await request.body()))
+        return {"bytes": received[-1]}
+
+    return TestClient(RequestSizeLimit(echo, max_bytes=100)), received
+
+
+def test_content_length_over_the_limit_is_rejected_before_the_app(limited):
+    client, received = limited
+
+    assert client.post("/upload_files", content=b"x" * 100).json() == {"bytes": 100}
+    response = client.post("/upload_files", content=b"x" * 101)
+    assert response.status_code == 413 and "request limit" in response.json()["detail"]
+    assert received == [100]
+
+
+def test_chunked_body_over_the_limit_is_rejected_while_read(limited):
+    client, received = limited
+
+    def body():
+        for _ in range(10):
+            yield b"x" * 30
+
+    response = client.post("/upload_files", content=body())
+    assert response.status_code == 413
+    assert received == []
+
+
+# ---------- /upload_files ----------
+
+@pytest.fixture
+def client():
+    import app
+    return TestClient(app.app)
+
+
+def post_files(client, html, *docs):
+    return client.post("/upload_files", files=[("html_file", ("page.html", html, "text/html"))] + [
+        ("support_docs", (name, text, "text/markdown")) for name, text in docs
+    ])
+
+
+def stored_files():
+    paths = kb_paths()
+    return {name: open(os.path.join(directory, name)).read()
+            for directory in (paths["html_dir"], paths["docs_dir"]) for name in os.listdir(directory)}
+
+
+def test_rejected_request_leaves_no_staged_files(client, monkeypatch):
+    monkeypatch.setattr("app.submit_build", lambda build, key: {"id": "job", "submissions": 1})
+    assert post_files(client, "<p>v1</p>", ("rules.md", "SAVE10")).status_code == 202
+
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_FILE_BYTES", 20)
+    response = post_files(client, "<p>v2</p>", ("rules.md", "SAVE20"), ("big.md", "x" * 21))
+
+    assert response.status_code == 413
+    # Neither the accepted files of the request nor their .part files are left behind
+    assert stored_files() == {"page.html": "<p>v1</p>", "rules.md": "SAVE10"}
+
+
+def test_unchanged_upload_queues_no_build(client, monkeypatch):
+    builds = []
+    monkeypatch.setattr("app.submit_build", lambda build, key: builds.append(key) or {"id": "job", "submissions": 1})
+    post_files(client, "<p>v1</p>", ("rules.md", "SAVE10"))
+
+    response = post_files(client, "<p>v1</p>", ("rules.md", "SAVE10"))
+
+    assert response.status_code == 200 and len(builds) == 1
+    assert len(response.json()["uploads"]["duplicates"]) == 2